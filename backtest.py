@@ -0,0 +1,333 @@
+# backtest.py
+"""
+Backtest del screen de short PUT sobre el archivo histórico de cadenas.
+
+Para cada fecha del archivo (ARCHIVE_DIR, ver providers.ArchivingProvider)
+se reproduce una ejecución con ReplayProvider y se aplica el mismo análisis
+que main.py (pre-filtro y analyze_ticker), con los días a vencimiento
+calculados desde el momento archivado. Las fechas se procesan en paralelo en
+un pool de procesos. Cada PUT seleccionado (un contrato por selección) se
+liquida a vencimiento con el precio del subyacente: el último precio
+archivado ese día o, si no lo hay, el cierre diario de yfinance.
+
+    python backtest.py --group nasdaq_short_put --start 2025-01-01 --end 2025-12-31
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from config import (ARCHIVE_DIR, BACKTEST_MAX_PRICE_GAP_DAYS, BACKTEST_PROCESSES, CACHE_TTL, CACHE_TTL_MARKET_CLOSED,
+                    GROUPS_CONFIG, INCREMENTAL_MAX_AGE_HOURS)
+from data_fetcher import SnapshotStore, empty_contracts
+from option_analyzer import analyze_ticker, prescreen_tickers
+from providers import ReplayProvider, load_recorded_quotes
+from storage import load_json
+
+logger = logging.getLogger(__name__)
+
+TRADE_COLUMNS = ["trade_date", "ticker", "strike", "expiration", "days_to_expiration", "last_price", "net_risk",
+                 "rentabilidad_anual"]
+
+def list_archive_runs(root, start=None, end=None):
+    """
+    Ejecuciones archivadas por fecha: dict 'YYYY-MM-DD' -> directorios de ejecución en orden cronológico.
+    """
+    runs = {}
+    for manifest in sorted(glob.glob(os.path.join(root, "date=*", "run=*", "manifest.json"))):
+        run_dir = os.path.dirname(manifest)
+        day = os.path.basename(os.path.dirname(run_dir))[len("date="):]
+        if (start and day < start) or (end and day > end):
+            continue
+        runs.setdefault(day, []).append(run_dir)
+    return dict(sorted(runs.items()))
+
+# Una ejecución solo archiva lo que descarga. Lo que sirvió desde la caché se
+# descargó como mucho el mayor TTL antes, y un ticker reutilizado por el
+# re-escaneo incremental se evaluó (quizá también desde la caché) como mucho
+# INCREMENTAL_MAX_AGE_HOURS antes: sus cadenas están en esas ejecuciones anteriores
+CACHE_LOOKBACK = (timedelta(seconds=max(max(CACHE_TTL.values()), CACHE_TTL_MARKET_CLOSED))
+                  + timedelta(hours=INCREMENTAL_MAX_AGE_HOURS))
+
+def _run_moment(run_dir):
+    day = os.path.basename(os.path.dirname(run_dir))[len("date="):]
+    return datetime.strptime(f"{day} {os.path.basename(run_dir)[len('run='):]}", '%Y-%m-%d %H%M%S_%f')
+
+def earlier_runs(runs_by_day, run_dir, lookback=CACHE_LOOKBACK):
+    """
+    Ejecuciones archivadas en los `lookback` anteriores a `run_dir`, de la más reciente a la más antigua.
+    """
+    moment = _run_moment(run_dir)
+    earlier = [other for run_dirs in runs_by_day.values() for other in run_dirs
+               if moment - lookback <= _run_moment(other) < moment]
+    return sorted(earlier, key=_run_moment, reverse=True)
+
+def screen_run(run_dir, group_config, fallback_dirs=()):
+    """
+    Reproduce el screen del grupo sobre una ejecución archivada.
+
+    Devuelve (contratos seleccionados con TRADE_COLUMNS, tickers sin datos
+    archivados). Los datos que la ejecución sirvió desde la caché o reutilizó
+    del estado incremental se leen de `fallback_dirs` (ver earlier_runs); un
+    ticker cuyos datos no aparecen se devuelve aparte en lugar de contarse
+    como "sin contratos".
+    """
+    provider = ReplayProvider(run_dir, fallback_dirs)
+    config = group_config["config"]
+    # Los tickers cotizados en esa ejecución: todos los que el escaneo en vivo pudo evaluar
+    tickers = list(dict.fromkeys(group_config["tickers"]))
+    quotes = provider.get_quotes(tickers)
+    tickers = [ticker for ticker in tickers if ticker in quotes]
+    snapshots = SnapshotStore(provider, quotes)
+    frames, missing = [], []
+    for ticker in prescreen_tickers(tickers, config, quotes):
+        details = {}
+        contracts = analyze_ticker(ticker, config, snapshots.get(ticker), details)
+        snapshots.release(ticker)
+        if "error" in details:
+            missing.append(ticker)
+        elif len(contracts):
+            frames.append(contracts)
+    trades = pd.concat(frames, ignore_index=True) if frames else empty_contracts()
+    trades.insert(0, "trade_date", provider.now().strftime('%Y-%m-%d'))
+    return trades[TRADE_COLUMNS], missing
+
+def _screen_day(task):
+    day, run_dir, fallback_dirs, group_config = task
+    try:
+        trades, missing = screen_run(run_dir, group_config, fallback_dirs)
+        if missing:
+            logger.warning(f"{day}: {len(missing)} tickers sin datos archivados en {run_dir}: {', '.join(missing)}")
+        return trades, len(missing), False
+    except Exception as e:
+        logger.error(f"{day}: no se pudo reproducir {run_dir}: {e}")
+        return empty_contracts().assign(trade_date=[])[TRADE_COLUMNS], 0, True
+
+def _init_worker(log_level):
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(log_level)
+
+def archived_prices(runs_by_day):
+    """
+    Último precio archivado de cada ticker y día: DataFrame con índice de fechas y una columna por ticker.
+
+    Se usan las cotizaciones grabadas de cada ejecución y, si no hay, info.json de cada ticker.
+    """
+    rows = {}
+    for day, run_dirs in runs_by_day.items():
+        prices = {}
+        for run_dir in run_dirs:
+            quotes = load_recorded_quotes(run_dir)
+            if quotes is not None:
+                prices.update({ticker: quote["price"] for ticker, quote in quotes.items()})
+                continue
+            for info_path in glob.glob(os.path.join(run_dir, "*", "info.json")):
+                info = load_json(info_path)
+                price = info.get('regularMarketPrice', info.get('previousClose'))
+                if price:
+                    prices[os.path.basename(os.path.dirname(info_path))] = price
+        rows[day] = prices
+    prices = pd.DataFrame.from_dict(rows, orient="index", dtype=float)
+    prices.index = pd.to_datetime(prices.index)
+    return prices.sort_index()
+
+def fetch_closes(tickers, start, end):
+    """
+    Cierres diarios de yfinance entre `start` y `end` (incluido), en una sola descarga masiva.
+    """
+    import yfinance as yf
+    history = yf.download(list(tickers), start=start.strftime('%Y-%m-%d'),
+                          end=(end + timedelta(days=1)).strftime('%Y-%m-%d'), interval="1d", group_by="column",
+                          auto_adjust=False, progress=False, threads=True)
+    if history is None or history.empty:
+        return pd.DataFrame()
+    closes = history["Close"]
+    if closes.ndim == 1:
+        closes = closes.to_frame(list(tickers)[0])
+    closes.index = pd.to_datetime(closes.index).tz_localize(None)
+    return closes
+
+def _lookup(prices, tickers, dates, max_gap_days):
+    """
+    Precio de cada (ticker, fecha): el último disponible en o antes de la fecha, con como mucho `max_gap_days` de antigüedad.
+    """
+    result = np.full(len(tickers), np.nan)
+    if prices is None or prices.empty:
+        return result
+    for ticker in np.unique(tickers):
+        if ticker not in prices.columns:
+            continue
+        series = prices[ticker].dropna()
+        if series.empty:
+            continue
+        rows = np.flatnonzero(tickers == ticker)
+        wanted = dates[rows]
+        position = series.index.searchsorted(wanted, side="right") - 1
+        found = position >= 0
+        position = np.clip(position, 0, None)
+        gap = (wanted - series.index[position]).days.to_numpy()
+        ok = found & (gap <= max_gap_days)
+        result[rows[ok]] = series.to_numpy()[position[ok]]
+    return result
+
+def settle(trades, prices, today, max_gap_days=BACKTEST_MAX_PRICE_GAP_DAYS, fetch=fetch_closes):
+    """
+    Añade a `trades` el precio de liquidación y el resultado de cada PUT vendido.
+
+    Columnas nuevas: `settle_price`, `pnl` (dólares por contrato: prima menos
+    valor intrínseco al vencimiento), `return_on_risk` y `annualized_return`.
+    Los contratos aún no vencidos o sin precio quedan con NaN.
+    """
+    trades = trades.copy()
+    tickers = trades["ticker"].to_numpy(dtype=str)
+    expirations = pd.to_datetime(trades["expiration"], format='%Y-%m-%d')
+    dates = pd.DatetimeIndex(expirations)
+    expired = np.asarray(dates < pd.Timestamp(today))
+
+    settle_price = _lookup(prices, tickers, dates, max_gap_days)
+    settle_price[~expired] = np.nan
+    missing = expired & np.isnan(settle_price)
+    if missing.any() and fetch is not None:
+        try:
+            closes = fetch(np.unique(tickers[missing]), dates[missing].min() - timedelta(days=7), dates[missing].max())
+            # Vencimientos en festivo: se usa el cierre hábil anterior
+            settle_price[missing] = _lookup(closes, tickers[missing], dates[missing], 4)
+        except Exception as e:
+            logger.error(f"No se pudieron descargar cierres para liquidar {int(missing.sum())} contratos: {e}")
+
+    strike = trades["strike"].to_numpy(dtype=float)
+    premium = trades["last_price"].to_numpy(dtype=float)
+    net_risk = trades["net_risk"].to_numpy(dtype=float)
+    days = trades["days_to_expiration"].to_numpy(dtype=float)
+    pnl = (premium - np.maximum(strike - settle_price, 0)) * 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return_on_risk = pnl / net_risk
+        annualized = return_on_risk * 365 / days
+    trades["settle_price"] = settle_price
+    trades["pnl"] = pnl
+    trades["return_on_risk"] = return_on_risk
+    trades["annualized_return"] = annualized
+    return trades
+
+def summarize(trades, capital):
+    """
+    Métricas del backtest: tasa de acierto, rentabilidad anualizada realizada y drawdown sobre `capital`.
+
+    Las ganancias y pérdidas se realizan en la fecha de vencimiento. El
+    capital comprometido es la suma del riesgo neto de los contratos abiertos.
+    """
+    settled = trades[trades["pnl"].notna()]
+    summary = {
+        "trades": int(len(trades)),
+        "settled": int(len(settled)),
+        "open": int(len(trades) - len(settled)),
+        "dates": int(trades["trade_date"].nunique()),
+        "capital": capital,
+    }
+    if settled.empty:
+        return summary
+
+    pnl_by_day = settled.groupby("expiration")["pnl"].sum().sort_index()
+    equity = capital + pnl_by_day.cumsum().to_numpy()
+    peak = np.maximum.accumulate(np.concatenate([[capital], equity]))[1:]
+    drawdown = peak - equity
+    start = pd.Timestamp(settled["trade_date"].min())
+    end = pd.Timestamp(pnl_by_day.index[-1])
+    span_days = max((end - start).days, 1)
+    final_equity = float(equity[-1])
+
+    # Capital comprometido: +riesgo al abrir, -riesgo al vencer
+    events = pd.concat([
+        pd.Series(trades["net_risk"].to_numpy(), index=pd.to_datetime(trades["trade_date"])),
+        pd.Series(-trades["net_risk"].to_numpy(), index=pd.to_datetime(trades["expiration"])),
+    ]).groupby(level=0).sum().sort_index()
+    committed = events.cumsum()
+
+    summary.update({
+        "wins": int((settled["pnl"] > 0).sum()),
+        "win_rate": float((settled["pnl"] > 0).mean()),
+        "total_pnl": float(settled["pnl"].sum()),
+        "average_pnl": float(settled["pnl"].mean()),
+        "worst_trade": float(settled["pnl"].min()),
+        "average_trade_annualized_return": float(settled["annualized_return"].mean()),
+        "final_equity": final_equity,
+        "annualized_return": float(max(final_equity / capital, 0) ** (365 / span_days) - 1),
+        "max_drawdown": float(drawdown.max()),
+        "max_drawdown_pct": float(drawdown.max() / capital),
+        "max_capital_committed": float(committed.max()),
+        "max_capital_committed_pct": float(committed.max() / capital),
+        "start": start.strftime('%Y-%m-%d'),
+        "end": end.strftime('%Y-%m-%d'),
+    })
+    return summary
+
+def run_backtest(group_name, start=None, end=None, archive_dir=ARCHIVE_DIR, processes=BACKTEST_PROCESSES,
+                 run="first", today=None, log_level=logging.WARNING, fetch=fetch_closes):
+    """
+    Reproduce el screen sobre cada fecha archivada en paralelo y devuelve (operaciones liquidadas, resumen).
+
+    `run` elige qué ejecución de cada día se reproduce ("first" o "last").
+    """
+    group_config = GROUPS_CONFIG[group_name]
+    runs_by_day = list_archive_runs(archive_dir, start, end)
+    if not runs_by_day:
+        raise ValueError(f"No hay ejecuciones archivadas en {archive_dir} entre {start} y {end}")
+    all_runs = list_archive_runs(archive_dir)
+    tasks = []
+    for day, run_dirs in runs_by_day.items():
+        run_dir = run_dirs[0] if run == "first" else run_dirs[-1]
+        tasks.append((day, run_dir, earlier_runs(all_runs, run_dir), group_config))
+    logger.info(f"Backtest de {group_name}: {len(tasks)} fechas con {processes} procesos")
+
+    started = time.perf_counter()
+    if processes <= 1:
+        results = [_screen_day(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(log_level,)) as executor:
+            results = list(executor.map(_screen_day, tasks, chunksize=max(1, len(tasks) // (processes * 4))))
+    trades = pd.concat([frame for frame, _, _ in results], ignore_index=True)
+    logger.info(f"{len(trades)} contratos seleccionados en {time.perf_counter() - started:.1f}s")
+
+    # Los precios de liquidación salen de todas las ejecuciones archivadas, no solo de las fechas del rango
+    trades = settle(trades, archived_prices(all_runs), today or datetime.now(), fetch=fetch)
+    summary = summarize(trades, group_config["config"]["CAPITAL"])
+    # Datos que faltan en el archivo: el resultado de esas fechas está incompleto
+    summary["missing_ticker_days"] = sum(missing for _, missing, _ in results)
+    summary["failed_dates"] = sum(failed for _, _, failed in results)
+    if summary["missing_ticker_days"] or summary["failed_dates"]:
+        logger.warning(f"Backtest incompleto: {summary['missing_ticker_days']} tickers-día sin datos archivados, "
+                       f"{summary['failed_dates']} fechas sin reproducir")
+    return trades, summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest del screen de short PUT sobre el archivo histórico")
+    parser.add_argument("--group", default=next(iter(GROUPS_CONFIG)), help="Grupo de GROUPS_CONFIG que se reproduce")
+    parser.add_argument("--start", help="Primera fecha (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Última fecha (YYYY-MM-DD)")
+    parser.add_argument("--archive", default=ARCHIVE_DIR, help="Directorio del archivo histórico")
+    parser.add_argument("--processes", type=int, default=BACKTEST_PROCESSES, help="Procesos en paralelo")
+    parser.add_argument("--run", choices=("first", "last"), default="first", help="Ejecución de cada día que se reproduce")
+    parser.add_argument("--output", default="backtest_results.json", help="Fichero JSON con el resumen")
+    parser.add_argument("--trades", help="Fichero CSV con todas las operaciones")
+    parser.add_argument("--log-level", default="WARNING", help="Nivel de logging del análisis")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    trades, summary = run_backtest(args.group, args.start, args.end, args.archive, args.processes, args.run,
+                                   log_level=args.log_level)
+    if args.trades:
+        trades.to_csv(args.trades, index=False)
+    with open(args.output, "w") as f:
+        json.dump(summary, f, indent=2)
+    for key, value in summary.items():
+        print(f"{key:32s} {value:.4f}" if isinstance(value, float) else f"{key:32s} {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# benchmark.py
+"""
+Benchmark offline del pipeline sobre cadenas sintéticas del NASDAQ-100.
+
+Genera cadenas de opciones realistas para todos los tickers (sin red), mide
+cada etapa (filtro de IV, filtro de PUTs, ranking y formateo de mensajes) y
+guarda los tiempos en JSON. Con --baseline compara contra una ejecución
+anterior y termina con código 1 si alguna etapa empeora más que --tolerance.
+
+    python benchmark.py --strikes 200 --expirations 8 --save-baseline
+    python benchmark.py --baseline benchmark_baseline.json
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from config import GROUPS_CONFIG, NASDAQ_100_TICKERS
+from data_fetcher import TickerSnapshot, get_option_data, get_ticker_iv
+from discord_notifier import build_messages
+from option_analyzer import rank_global, select_top
+from providers import MarketDataProvider
+
+logger = logging.getLogger(__name__)
+
+# Fecha fija para que los días a vencimiento (y los resultados) sean reproducibles
+BENCHMARK_NOW = datetime(2025, 1, 6, 16, 0)
+
+def _synthetic_chain(rng, price, strikes, days, base_iv):
+    """
+    Cadena de opciones con strikes en torno al precio, sonrisa de volatilidad y primas coherentes.
+    """
+    strike = np.round(np.linspace(price * 0.5, price * 1.5, strikes), 2)
+    moneyness = np.log(strike / price)
+    iv = np.clip(base_iv * (1 + 1.5 * moneyness ** 2 - 0.3 * moneyness) + rng.normal(0, 0.02, strikes), 0.05, None)
+    # Prima aproximada: valor intrínseco + valor temporal decreciente con la distancia al dinero
+    time_value = price * iv * np.sqrt(days / 365) * 0.4 * np.exp(-np.abs(moneyness) / (iv * np.sqrt(days / 365) + 1e-9))
+    last_price = np.round(np.maximum(strike - price, 0) + time_value + rng.normal(0, 0.05, strikes).clip(0), 2)
+    bid = np.round(np.maximum(last_price - rng.uniform(0.01, 0.2, strikes), 0), 2)
+    volume = rng.integers(0, 500, strikes).astype(float)
+    volume[rng.random(strikes) < 0.1] = np.nan
+    open_interest = rng.integers(0, 5000, strikes).astype(float)
+    return pd.DataFrame({
+        "contractSymbol": [f"SYN{i:05d}" for i in range(strikes)],
+        "strike": strike,
+        "lastPrice": last_price,
+        "bid": bid,
+        "ask": bid + 0.05,
+        "volume": volume,
+        "openInterest": open_interest,
+        "impliedVolatility": iv,
+        "inTheMoney": strike > price,
+    })
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Proveedor sin red con datos sintéticos deterministas por ticker, generados una sola vez.
+    """
+    def __init__(self, tickers, strikes=120, expirations=8, seed=0):
+        self.tickers = list(tickers)
+        self.strikes = strikes
+        self._info = {}
+        self._expirations = {}
+        self._chains = {}
+        for ticker in self.tickers:
+            rng = np.random.default_rng(zlib.crc32(ticker.encode()) + seed)
+            price = float(rng.uniform(20, 200))
+            base_iv = float(rng.uniform(0.25, 0.8))
+            self._info[ticker] = {
+                "regularMarketPrice": price,
+                "previousClose": price * float(rng.uniform(0.97, 1.03)),
+                "averageVolume": int(rng.integers(100_000, 20_000_000)),
+            }
+            # Vencimientos semanales: algunos dentro y otros fuera del horizonte configurado
+            dates = [(BENCHMARK_NOW + timedelta(days=3 + 7 * i)).strftime('%Y-%m-%d') for i in range(expirations)]
+            self._expirations[ticker] = dates
+            for expiration in dates:
+                days = (datetime.strptime(expiration, '%Y-%m-%d') - BENCHMARK_NOW).days + 1
+                self._chains[(ticker, expiration)] = (
+                    _synthetic_chain(rng, price, strikes, days, base_iv),
+                    _synthetic_chain(rng, price, strikes, days, base_iv),
+                )
+
+    def now(self):
+        return BENCHMARK_NOW
+
+    def get_info(self, ticker):
+        return self._info[ticker]
+
+    def get_expirations(self, ticker):
+        return self._expirations[ticker]
+
+    def get_option_chain(self, ticker, expiration):
+        return self._chains[(ticker, expiration)]
+
+def _time_stage(function, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return {"median_seconds": statistics.median(timings), "min_seconds": min(timings)}, result
+
+def run_benchmark(tickers, strikes, expirations, repeat, config):
+    """
+    Ejecuta cada etapa `repeat` veces sobre los datos sintéticos y devuelve el resultado como dict.
+    """
+    provider = SyntheticProvider(tickers, strikes, expirations)
+    snapshots = {ticker: TickerSnapshot(ticker, provider) for ticker in tickers}
+    stages = {}
+
+    stages["iv_screen"], screened = _time_stage(
+        lambda: [t for t in tickers if get_ticker_iv(t, config, snapshots[t])], repeat)
+    stages["put_filter"], options_by_ticker = _time_stage(
+        lambda: {t: get_option_data(t, config, snapshots[t]) for t in screened}, repeat)
+
+    def rank():
+        ranked = {ticker: select_top(options, config["TOP_CONTRATOS_PER_TICKER"])
+                  for ticker, options in options_by_ticker.items()}
+        return ranked, rank_global(ranked, config["TOP_CONTRATOS_GLOBAL"], config["RANKING_GLOBAL"])
+    stages["ranking"], (best, global_top) = _time_stage(rank, repeat)
+    stages["message_format"], messages = _time_stage(lambda: build_messages(best, "Benchmark", global_top), repeat)
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "params": {"tickers": len(tickers), "strikes": strikes, "expirations": expirations, "repeat": repeat},
+        "stages": stages,
+        "totals": {
+            "contracts": len(tickers) * expirations * strikes * 2,
+            "tickers_screened": len(screened),
+            "contracts_selected": sum(len(options) for options in best.values()),
+            "messages": len(messages),
+        },
+    }
+
+def compare(results, baseline, tolerance, min_delta_seconds=0.001):
+    """
+    Compara cada etapa con la línea base y devuelve la lista de etapas que empeoran más que `tolerance`.
+
+    Las diferencias absolutas menores que `min_delta_seconds` se ignoran, ya
+    que en etapas de microsegundos son ruido de medida.
+    """
+    regressions = []
+    if baseline.get("params") != results["params"]:
+        logger.warning(f"Los parámetros difieren de la línea base: {baseline.get('params')} != {results['params']}")
+    for stage, timing in results["stages"].items():
+        reference = baseline.get("stages", {}).get(stage)
+        if not reference:
+            continue
+        ratio = timing["median_seconds"] / max(reference["median_seconds"], 1e-9)
+        regressed = (ratio > 1 + tolerance
+                     and timing["median_seconds"] - reference["median_seconds"] > min_delta_seconds)
+        status = "REGRESIÓN" if regressed else "ok"
+        print(f"{stage:15s} {reference['median_seconds']*1000:10.2f} ms -> {timing['median_seconds']*1000:10.2f} ms  x{ratio:.2f}  {status}")
+        if regressed:
+            regressions.append(stage)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline del screen de short PUT")
+    parser.add_argument("--group", default=next(iter(GROUPS_CONFIG)), help="Grupo de GROUPS_CONFIG cuyos filtros se usan")
+    parser.add_argument("--strikes", type=int, default=120, help="Strikes por vencimiento")
+    parser.add_argument("--expirations", type=int, default=8, help="Vencimientos por ticker")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por etapa (se usa la mediana)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Fichero JSON de resultados")
+    parser.add_argument("--baseline", help="Línea base JSON con la que comparar")
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar también los resultados como línea base")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Empeoramiento relativo permitido por etapa")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = GROUPS_CONFIG[args.group]["config"]
+    tickers = list(dict.fromkeys(NASDAQ_100_TICKERS))
+    results = run_benchmark(tickers, args.strikes, args.expirations, args.repeat, config)
+
+    for stage, timing in results["stages"].items():
+        print(f"{stage:15s} mediana {timing['median_seconds']*1000:10.2f} ms  mínimo {timing['min_seconds']*1000:10.2f} ms")
+    print(f"Totales: {results['totals']}")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline or "benchmark_baseline.json", "w") as f:
+            json.dump(results, f, indent=2)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+# cache.py
+import glob
+import logging
+import os
+import threading
+import time
+from market_calendar import is_market_open
+from storage import load_frames, load_json, save_frames, save_json
+
+logger = logging.getLogger(__name__)
+
+# Extensión de fichero por tipo de dato
+_EXTENSIONS = {"info": "json", "expirations": "json", "chain": "npz"}
+
+class OptionChainCache:
+    """
+    Caché en disco de los datos del proveedor de mercado.
+
+    Cada entrada se identifica por ticker, tipo de dato (info, expirations,
+    chain), vencimiento y momento de descarga, y se guarda como
+    `<directorio>/<ticker>/<tipo>[_<vencimiento>]_<timestamp>.<ext>`. Las
+    cadenas usan el formato columnar .npz de `storage`. Cada tipo tiene su TTL;
+    con el mercado cerrado se acepta cualquier entrada más reciente que
+    `closed_market_ttl`, ya que los datos no cambian hasta la apertura.
+    """
+    def __init__(self, directory, ttls, closed_market_ttl=0, max_bytes=None):
+        self.directory = directory
+        self.ttls = ttls
+        self.closed_market_ttl = closed_market_ttl
+        self.max_bytes = max_bytes
+        self.stats = {kind: {"hits": 0, "misses": 0} for kind in _EXTENSIONS}
+        self._lock = threading.Lock()
+
+    def _prefix(self, kind, ticker, expiration=None):
+        name = kind if expiration is None else f"{kind}_{expiration}"
+        return os.path.join(self.directory, ticker.upper(), name)
+
+    def _entries(self, prefix, kind):
+        """
+        Devuelve las entradas existentes de una clave como lista de (timestamp, ruta), la más reciente primero.
+        """
+        entries = []
+        for path in glob.glob(f"{glob.escape(prefix)}_*.{_EXTENSIONS[kind]}"):
+            stamp = os.path.basename(path).rsplit("_", 1)[-1].split(".", 1)[0]
+            if stamp.isdigit():
+                entries.append((int(stamp), path))
+        return sorted(entries, reverse=True)
+
+    def _max_age(self, kind):
+        ttl = self.ttls.get(kind, 0)
+        if not is_market_open():
+            ttl = max(ttl, self.closed_market_ttl)
+        return ttl
+
+    def _record(self, kind, hit):
+        with self._lock:
+            self.stats[kind]["hits" if hit else "misses"] += 1
+
+    def get(self, kind, ticker, expiration=None):
+        """
+        Devuelve el valor en caché si existe y no ha caducado; si no, None.
+
+        `info` y `expirations` se devuelven tal cual se guardaron; `chain` se
+        devuelve como tupla (puts, calls).
+        """
+        entries = self._entries(self._prefix(kind, ticker, expiration), kind)
+        if entries:
+            fetched_at, path = entries[0]
+            if time.time() - fetched_at <= self._max_age(kind):
+                try:
+                    if kind == "chain":
+                        frames, _ = load_frames(path)
+                        value = (frames["puts"], frames["calls"])
+                    else:
+                        value = load_json(path)
+                    self._record(kind, True)
+                    return value
+                except Exception as e:
+                    logger.warning(f"Entrada de caché corrupta {path}: {e}")
+        self._record(kind, False)
+        return None
+
+    def put(self, kind, ticker, value, expiration=None):
+        """
+        Guarda un valor recién descargado y elimina las entradas anteriores de la misma clave.
+        """
+        prefix = self._prefix(kind, ticker, expiration)
+        fetched_at = int(time.time())
+        path = f"{prefix}_{fetched_at}.{_EXTENSIONS[kind]}"
+        try:
+            if kind == "chain":
+                puts, calls = value
+                save_frames(path, {"puts": puts, "calls": calls},
+                            meta={"ticker": ticker, "expiration": expiration, "fetched_at": fetched_at})
+            else:
+                save_json(path, value)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar en caché {path}: {e}")
+            return
+        for _, old_path in self._entries(prefix, kind):
+            if old_path != path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """
+        Elimina las entradas más antiguas hasta que la caché ocupe como máximo `max_bytes`.
+        """
+        if not self.max_bytes or not os.path.isdir(self.directory):
+            return 0
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Caché: eliminadas {removed} entradas antiguas ({total / 1e6:.1f} MB en uso)")
+        return removed
+
+    def summary(self):
+        """
+        Devuelve un resumen legible de aciertos y fallos por tipo de dato.
+        """
+        parts = [f"{kind}: {counts['hits']} aciertos / {counts['misses']} fallos"
+                 for kind, counts in self.stats.items()]
+        return "Caché de datos de mercado - " + ", ".join(parts)
@@ -14,6 +14,97 @@ NASDAQ_100_TICKERS = [
     "NDAQ", "TTWO", "ON", "ENPH", "CEG", "FANG", "GFS", "GEHC"
 ]
 
+# Nivel de logging (DEBUG muestra el detalle de cada vencimiento y descarte)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Informe JSON con tiempos por etapa, peticiones y descartes de cada ejecución
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH", "run_report.json")
+
+# Ejecución concurrente: número de tickers analizados en paralelo y límite de
+# peticiones al proveedor de datos (token bucket compartido por todos los hilos)
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+MAX_REQUESTS_PER_SECOND = float(os.getenv("MAX_REQUESTS_PER_SECOND", "5"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+# La cotización masiva del pre-filtro hace una petición por ticker: se descarga
+# en bloques de QUOTES_CHUNK_SIZE tickers y cada ticker consume un token
+QUOTES_CHUNK_SIZE = int(os.getenv("QUOTES_CHUNK_SIZE", "20"))
+
+# Proveedor de datos de mercado: "yfinance" (en vivo) o "replay" (reproduce una
+# grabación de REPLAY_DIR sin red). Si RECORD_DIR está definido, todas las
+# respuestas del proveedor se graban ahí para reproducirlas después.
+DATA_PROVIDER = os.getenv("DATA_PROVIDER", "yfinance")
+REPLAY_DIR = os.getenv("REPLAY_DIR", "recordings/latest")
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+
+# Archivo histórico de cadenas (append-only, particionado por fecha) que usa
+# el backtest (python backtest.py); cada ejecución añade un directorio nuevo.
+# Al terminar cada escaneo se borran las fechas de más de ARCHIVE_MAX_DAYS días
+# (0 = conservar todo). El workflow de GitHub Actions lo guarda en una entrada
+# de caché propia, separada de la caché de datos y del estado incremental
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") == "1"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", ".cache/archive")
+ARCHIVE_MAX_DAYS = int(os.getenv("ARCHIVE_MAX_DAYS", "60"))
+# Backtest: procesos en paralelo (uno por fecha) y máximo de días entre el
+# vencimiento y el último precio archivado para liquidar sin consultar yfinance
+BACKTEST_PROCESSES = int(os.getenv("BACKTEST_PROCESSES", str(os.cpu_count() or 1)))
+BACKTEST_MAX_PRICE_GAP_DAYS = int(os.getenv("BACKTEST_MAX_PRICE_GAP_DAYS", "3"))
+
+# Envío de notificaciones a Discord en segundo plano (no bloquea el escaneo del
+# siguiente grupo; varios webhooks se atienden en paralelo)
+NOTIFY_IN_BACKGROUND = os.getenv("NOTIFY_IN_BACKGROUND", "1") == "1"
+
+# Modo streaming: los contratos se envían a Discord a medida que se analizan
+# los tickers (un mensaje en cuanto se llena o cada STREAM_FLUSH_SECONDS) y al
+# final se envía un resumen con el ranking global
+STREAM_NOTIFICATIONS = os.getenv("STREAM_NOTIFICATIONS", "0") == "1"
+STREAM_FLUSH_SECONDS = float(os.getenv("STREAM_FLUSH_SECONDS", "30"))
+
+# Escaneo por shards de un universo grande (python sharding.py): el universo se
+# lee de UNIVERSE_PATH (un ticker por línea), se parte en shards de SHARD_SIZE
+# tickers y cada shard se procesa en uno de SHARD_PROCESSES procesos. Por
+# defecto MAX_REQUESTS_PER_SECOND se reparte entre los procesos;
+# SHARD_REQUESTS_PER_SECOND fija en su lugar el límite de cada proceso.
+UNIVERSE_PATH = os.getenv("UNIVERSE_PATH", "universe.txt")
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", "200"))
+SHARD_PROCESSES = int(os.getenv("SHARD_PROCESSES", "4"))
+SHARD_DIR = os.getenv("SHARD_DIR", ".cache/shards")
+SHARD_REQUESTS_PER_SECOND = (float(os.environ["SHARD_REQUESTS_PER_SECOND"])
+                             if os.getenv("SHARD_REQUESTS_PER_SECOND") else None)
+
+# Modo daemon (python daemon.py): proceso residente que repite el escaneo de
+# todos los grupos cada DAEMON_INTERVAL_MINUTES conservando las sesiones HTTP.
+# Con DAEMON_MARKET_HOURS_ONLY solo se escanea con el mercado abierto y, fuera
+# de horario, se espera a la próxima apertura más DAEMON_OPEN_DELAY_MINUTES.
+# Los cambios en este fichero se aplican en la siguiente pasada sin reiniciar
+# (salvo DATA_PROVIDER y CACHE_*, que se leen al arrancar).
+DAEMON_INTERVAL_MINUTES = float(os.getenv("DAEMON_INTERVAL_MINUTES", "30"))
+DAEMON_MARKET_HOURS_ONLY = os.getenv("DAEMON_MARKET_HOURS_ONLY", "1") == "1"
+DAEMON_OPEN_DELAY_MINUTES = float(os.getenv("DAEMON_OPEN_DELAY_MINUTES", "5"))
+
+# Re-escaneo incremental: los tickers cuyo precio no se ha movido más de
+# INCREMENTAL_MAX_SPOT_CHANGE (fracción) y cuyos vencimientos, último cierre y
+# filtros no han cambiado reutilizan los contratos de la ejecución anterior
+# (guardados en STATE_PATH). "Sin cambios" no mira las cadenas: la IV ATM, las
+# primas y los bid pueden moverse dentro de la sesión sin que se re-evalúe el
+# ticker hasta que pasen INCREMENTAL_MAX_AGE_HOURS horas
+INCREMENTAL_ENABLED = os.getenv("INCREMENTAL_ENABLED", "1") == "1"
+STATE_PATH = os.getenv("STATE_PATH", ".cache/scan_state.json")
+INCREMENTAL_MAX_SPOT_CHANGE = float(os.getenv("INCREMENTAL_MAX_SPOT_CHANGE", "0.005"))
+INCREMENTAL_MAX_AGE_HOURS = float(os.getenv("INCREMENTAL_MAX_AGE_HOURS", "12"))
+
+# Caché en disco de info, vencimientos y cadenas de opciones (TTL en segundos).
+# Con el mercado cerrado se reutiliza cualquier dato más reciente que
+# CACHE_TTL_MARKET_CLOSED.
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache/market_data")
+CACHE_TTL = {
+    "info": 15 * 60,
+    "expirations": 6 * 3600,
+    "chain": 15 * 60,
+}
+CACHE_TTL_MARKET_CLOSED = 8 * 3600
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "500"))
+
 GROUPS_CONFIG = {
     "nasdaq_short_put": {
         "tickers": NASDAQ_100_TICKERS,
@@ -24,6 +115,7 @@ GROUPS_CONFIG = {
             "MIN_RENTABILIDAD_ANUAL": 35.0,
             "TARGET_DELTA_MIN": -0.20,
             "TARGET_DELTA_MAX": 0.0,
+            "RISK_FREE_RATE": 0.045,  # Tipo libre de riesgo anual para las griegas
             "MIN_VOLUMEN": 1,
             "MIN_OPEN_INTEREST": 1,
             "MIN_BID": 0.30,
@@ -34,6 +126,8 @@ GROUPS_CONFIG = {
             "MAX_STOCK_PRICE": 170.0,
             "MIN_STRIKE_DISTANCE": 0.05,
             "TOP_CONTRATOS_PER_TICKER": 5,
+            "TOP_CONTRATOS_GLOBAL": 10,  # Mejores contratos del grupo entre todos los tickers
+            "RANKING_GLOBAL": "rentabilidad_anual",  # o "rentabilidad_por_riesgo"
         }
     }
 }
@@ -0,0 +1,156 @@
+# daemon.py
+"""
+Modo daemon: proceso residente que repite el escaneo de todos los grupos.
+
+A diferencia de lanzar main.py desde cron, el intérprete, los módulos
+(pandas, numpy, yfinance) y las sesiones HTTP de yfinance y Discord se
+cargan una sola vez y se reutilizan en cada pasada. Las pasadas se programan
+cada DAEMON_INTERVAL_MINUTES dentro del horario de mercado y config.py se
+recarga automáticamente cuando cambia.
+
+    python daemon.py
+    python daemon.py --interval 15 --ignore-market-hours
+
+Los módulos pesados se importan después de leer los argumentos, de modo que
+`python daemon.py --help` responde al instante.
+"""
+import argparse
+import importlib
+import logging
+import os
+import signal
+import sys
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+import config
+from market_calendar import MARKET_TZ, is_market_open, next_market_open
+
+logger = logging.getLogger(__name__)
+
+class ConfigWatcher:
+    """
+    Recarga un módulo de configuración cuando cambia la fecha de modificación de su fichero.
+
+    Si el fichero nuevo no compila se mantiene la configuración anterior.
+    """
+    def __init__(self, module):
+        self.module = module
+        self.path = module.__file__
+        self.mtime = self._mtime()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_if_changed(self):
+        mtime = self._mtime()
+        if mtime is None or mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        try:
+            with open(self.path) as f:
+                compile(f.read(), self.path, "exec")
+            importlib.reload(self.module)
+        except Exception as e:
+            logger.error(f"No se pudo recargar {self.path}, se mantiene la configuración anterior: {e}")
+            return False
+        logger.info(f"Configuración recargada desde {self.path}")
+        return True
+
+def _apply_settings():
+    # Ajustes que otros módulos leen una sola vez al importarse
+    import data_fetcher
+    logging.getLogger().setLevel(config.LOG_LEVEL)
+    data_fetcher.rate_limiter.set_rate(config.MAX_REQUESTS_PER_SECOND, config.RATE_LIMIT_BURST)
+
+def next_run_time(after, interval_minutes, market_hours_only, open_delay_minutes):
+    """
+    Momento (UTC) de la siguiente pasada: `after` más el intervalo, o la próxima apertura si el mercado está cerrado.
+    """
+    candidate = after + timedelta(minutes=interval_minutes)
+    if market_hours_only and not is_market_open(candidate):
+        candidate = next_market_open(candidate) + timedelta(minutes=open_delay_minutes)
+    return candidate
+
+def run_daemon(interval_minutes=None, market_hours_only=None, max_runs=None):
+    """
+    Ejecuta pasadas hasta recibir SIGINT/SIGTERM (o hasta `max_runs` pasadas).
+
+    `interval_minutes` y `market_hours_only` sustituyen a los valores de
+    config.py; si no se indican se leen en cada pasada, así que también se
+    pueden cambiar editando config.py. Una señal de parada deja terminar la
+    pasada en curso.
+    """
+    import data_fetcher
+    from instrumentation import metrics
+    from main import run_scan
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"Señal {signum} recibida, el daemon terminará tras la pasada en curso")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    def schedule(after, interval=None):
+        if interval is None:
+            interval = interval_minutes if interval_minutes is not None else config.DAEMON_INTERVAL_MINUTES
+        market_only = market_hours_only if market_hours_only is not None else config.DAEMON_MARKET_HOURS_ONLY
+        return next_run_time(after, interval, market_only, config.DAEMON_OPEN_DELAY_MINUTES)
+
+    watcher = ConfigWatcher(config)
+    # La primera pasada se hace en cuanto se pueda: ya mismo si el mercado está abierto
+    last_start = None
+    next_at = schedule(datetime.now(timezone.utc), interval=0)
+    runs = 0
+    logger.info(f"Daemon iniciado; primera pasada: {next_at.astimezone(MARKET_TZ):%Y-%m-%d %H:%M %Z}")
+    while not stop.is_set():
+        if watcher.reload_if_changed():
+            _apply_settings()
+            if last_start is not None:
+                next_at = schedule(last_start)
+        now = datetime.now(timezone.utc)
+        if now < next_at:
+            # Se despierta al menos cada minuto para detectar cambios de configuración
+            stop.wait(min(60.0, (next_at - now).total_seconds()))
+            continue
+
+        last_start = now
+        metrics.reset()
+        data_fetcher.market_provider.refresh()
+        try:
+            run_scan()
+        except Exception as e:
+            logger.error(f"Error en la pasada del daemon: {e}")
+            logger.error(traceback.format_exc())
+        runs += 1
+        if max_runs is not None and runs >= max_runs:
+            break
+        next_at = schedule(last_start)
+        logger.info(f"Pasada {runs} completada; siguiente: {next_at.astimezone(MARKET_TZ):%Y-%m-%d %H:%M %Z}")
+    logger.info(f"Daemon detenido tras {runs} pasadas")
+    return runs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen de short PUT en modo residente")
+    parser.add_argument("--interval", type=float, help="Minutos entre pasadas (por defecto DAEMON_INTERVAL_MINUTES)")
+    parser.add_argument("--ignore-market-hours", action="store_true", help="Escanear también con el mercado cerrado")
+    parser.add_argument("--max-runs", type=int, help="Terminar tras este número de pasadas")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        run_daemon(args.interval, False if args.ignore_market_hours else None, args.max_runs)
+        return 0
+    except Exception as e:
+        logger.error(f"Error fatal en el daemon: {e}")
+        logger.error(traceback.format_exc())
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
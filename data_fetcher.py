@@ -1,27 +1,186 @@
 # data_fetcher.py
-import yfinance as yf
 import logging
+import threading
 import numpy as np
+import pandas as pd
 from datetime import datetime
+from cache import OptionChainCache
+from config import (ARCHIVE_DIR, ARCHIVE_ENABLED, CACHE_DIR, CACHE_ENABLED, CACHE_MAX_MB, CACHE_TTL,
+                    CACHE_TTL_MARKET_CLOSED, DATA_PROVIDER, MAX_REQUESTS_PER_SECOND, QUOTES_CHUNK_SIZE, RATE_LIMIT_BURST,
+                    RECORD_DIR, REPLAY_DIR)
+from greeks import black_scholes_greeks
+from instrumentation import metrics
+from providers import ArchivingProvider, CachingProvider, RecordingProvider, ReplayProvider, YFinanceProvider
+from rate_limiter import TokenBucket
 
-# Configurar logging para mostrar en consola
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_ticker_iv(ticker, config):
+# Limitador compartido por todos los hilos que consultan al proveedor de datos
+rate_limiter = TokenBucket(MAX_REQUESTS_PER_SECOND, RATE_LIMIT_BURST)
+
+# Caché en disco compartida; None si está desactivada o si se reproducen datos grabados
+market_cache = (OptionChainCache(CACHE_DIR, CACHE_TTL, CACHE_TTL_MARKET_CLOSED, CACHE_MAX_MB * 1024 * 1024)
+                if CACHE_ENABLED and DATA_PROVIDER != "replay" else None)
+
+def build_provider(name=DATA_PROVIDER):
+    """
+    Construye el proveedor de datos configurado: yfinance (con caché) o reproducción de una grabación.
+
+    Los datos en vivo se guardan además en el archivo histórico si
+    ARCHIVE_ENABLED. El archivo va por debajo de la caché: solo se archivan
+    las descargas reales, y un acierto de caché queda en la ejecución que lo
+    descargó (el backtest lo busca allí).
+    """
+    if name == "replay":
+        provider = ReplayProvider(REPLAY_DIR)
+    elif name == "yfinance":
+        provider = YFinanceProvider(rate_limiter, QUOTES_CHUNK_SIZE)
+        if ARCHIVE_ENABLED:
+            provider = ArchivingProvider(provider, ARCHIVE_DIR)
+        if market_cache is not None:
+            provider = CachingProvider(provider, market_cache)
+    else:
+        raise ValueError(f"Proveedor de datos desconocido: {name}")
+    if RECORD_DIR:
+        provider = RecordingProvider(provider, RECORD_DIR)
+    return provider
+
+# Proveedor usado por defecto por TickerSnapshot
+market_provider = build_provider()
+
+def _info_from_quote(quote):
+    # Claves de `info` que usa el screen; las grabaciones antiguas no tienen previous_close
+    if not quote or "previous_close" not in quote:
+        return None
+    return {
+        "regularMarketPrice": quote["price"],
+        "previousClose": quote["previous_close"],
+        "averageVolume": quote["average_volume"],
+    }
+
+class TickerSnapshot:
+    """
+    Datos de mercado de un ticker descargados una sola vez por ejecución.
+
+    La información del subyacente, la lista de vencimientos y las cadenas de
+    opciones se obtienen bajo demanda y se guardan, de modo que el filtro de IV
+    y el filtro de PUTs comparten las mismas descargas. Con `quote` (de la
+    cotización masiva) la información del subyacente no se vuelve a pedir.
+    """
+    def __init__(self, ticker, provider=None, quote=None):
+        self.ticker = ticker
+        self.provider = provider if provider is not None else market_provider
+        self.as_of = self.provider.now()
+        self._info = _info_from_quote(quote)
+        self._expirations = None
+        self._chains = {}
+        # Protege la carga perezosa cuando varios grupos comparten el snapshot
+        self._lock = threading.RLock()
+
+    @property
+    def info(self):
+        with self._lock:
+            if self._info is None:
+                logger.debug("Obteniendo información del ticker %s...", self.ticker)
+                with metrics.timed("info_fetch", self.ticker):
+                    self._info = self.provider.get_info(self.ticker)
+            return self._info
+
+    @property
+    def current_price(self):
+        return self.info.get('regularMarketPrice', self.info.get('previousClose', 0))
+
+    @property
+    def previous_close(self):
+        return self.info.get('previousClose', 0)
+
+    @property
+    def average_volume(self):
+        return self.info.get('averageVolume', 0)
+
+    @property
+    def expirations(self):
+        with self._lock:
+            if self._expirations is None:
+                with metrics.timed("expirations", self.ticker):
+                    self._expirations = tuple(self.provider.get_expirations(self.ticker))
+            return self._expirations
+
+    def days_to_expiration(self, expiration):
+        """
+        Días naturales hasta el vencimiento, contados desde el momento de los datos.
+        """
+        return (datetime.strptime(expiration, '%Y-%m-%d') - self.as_of).days
+
+    def option_chain(self, expiration):
+        """
+        Devuelve las cadenas (puts, calls) de un vencimiento, descargándolas solo la primera vez.
+        """
+        with self._lock:
+            if expiration not in self._chains:
+                logger.debug("Obteniendo cadena de opciones para %s con vencimiento %s...", self.ticker, expiration)
+                with metrics.timed("chain_fetch", self.ticker):
+                    self._chains[expiration] = self.provider.get_option_chain(self.ticker, expiration)
+            return self._chains[expiration]
+
+    def prefetch(self, max_days):
+        """
+        Descarga de antemano info, vencimientos y todas las cadenas hasta `max_days` días.
+        """
+        try:
+            self.info
+            for expiration in self.expirations:
+                if self.days_to_expiration(expiration) <= max_days:
+                    self.option_chain(expiration)
+        except Exception as e:
+            # El análisis posterior volverá a intentarlo y registrará el error
+            logger.warning(f"{self.ticker}: Error precargando datos: {e}")
+
+class SnapshotStore:
+    """
+    Registro de TickerSnapshot compartido entre grupos, uno por ticker y ejecución.
+
+    Los snapshots de los tickers presentes en `quotes` toman la información
+    del subyacente de la cotización masiva.
+    """
+    def __init__(self, provider=None, quotes=None):
+        self.provider = provider
+        self.quotes = quotes or {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, ticker):
+        with self._lock:
+            if ticker not in self._snapshots:
+                self._snapshots[ticker] = TickerSnapshot(ticker, self.provider, self.quotes.get(ticker))
+            return self._snapshots[ticker]
+
+    def release(self, ticker):
+        """
+        Olvida el snapshot de un ticker para liberar sus cadenas de memoria.
+        """
+        with self._lock:
+            self._snapshots.pop(ticker, None)
+
+    def __len__(self):
+        return len(self._snapshots)
+
+def get_ticker_iv(ticker, config, snapshot=None, details=None):
     """
     Calcula la volatilidad implícita promedio del ticker usando opciones ATM.
+
+    Si falla la descarga o el cálculo devuelve None y, si se pasa `details`,
+    guarda el error en details["error"] para distinguirlo de un descarte.
     """
     try:
         logger.info(f"Obteniendo IV para {ticker}...")
-        stock = yf.Ticker(ticker)
-        logger.debug(f"Obteniendo información del ticker {ticker}...")
-        info = stock.info
-        current_price = info.get('regularMarketPrice', info.get('previousClose', 0))
-        volume = info.get('averageVolume', 0)
+        if snapshot is None:
+            snapshot = TickerSnapshot(ticker)
+        current_price = snapshot.current_price
+        volume = snapshot.average_volume
 
         # Log detallado de los datos obtenidos
-        logger.debug(f"Datos crudos para {ticker}: Precio actual: ${current_price:.2f}, Volumen promedio: {volume}")
+        logger.debug("Datos crudos para %s: Precio actual: $%.2f, Volumen promedio: %s", ticker, current_price, volume)
 
         # Verificar precio y volumen del subyacente
         if current_price <= 0:
@@ -34,38 +193,39 @@ def get_ticker_iv(ticker, config):
             logger.info(f"{ticker}: Descartado - Volumen promedio {volume} < {config['MIN_VOLUME_STOCK']}")
             return None
 
-        logger.debug(f"{ticker}: Precio actual: ${current_price:.2f}, Volumen promedio: {volume}")
+        logger.debug("%s: Precio actual: $%.2f, Volumen promedio: %s", ticker, current_price, volume)
 
-        expirations = stock.options
+        expirations = snapshot.expirations
         if not expirations:
             logger.info(f"{ticker}: Descartado - No hay fechas de vencimiento disponibles para opciones")
             return None
 
         iv_values = []
-        logger.debug(f"Procesando {len(expirations)} fechas de vencimiento para {ticker}...")
+        logger.debug("Procesando %d fechas de vencimiento para %s...", len(expirations), ticker)
         for expiration in expirations:
-            expiration_date = datetime.strptime(expiration, '%Y-%m-%d')
-            days_to_expiration = (expiration_date - datetime.now()).days
+            days_to_expiration = snapshot.days_to_expiration(expiration)
             if days_to_expiration > config["MAX_DIAS_VENCIMIENTO"]:
-                logger.debug(f"{ticker}: Expiración {expiration} descartada: {days_to_expiration} días (excede el máximo de {config['MAX_DIAS_VENCIMIENTO']})")
+                logger.debug("%s: Expiración %s descartada: %d días (excede el máximo de %s)",
+                             ticker, expiration, days_to_expiration, config['MAX_DIAS_VENCIMIENTO'])
                 continue
 
-            logger.debug(f"Obteniendo cadena de opciones para {ticker} con vencimiento {expiration} ({days_to_expiration} días)...")
-            opt = stock.option_chain(expiration)
-            for chain in [opt.puts, opt.calls]:
+            logger.debug("Procesando cadena de opciones para %s con vencimiento %s (%d días)...",
+                         ticker, expiration, days_to_expiration)
+            for chain in snapshot.option_chain(expiration):
                 if chain.empty:
-                    logger.debug(f"{ticker}: Cadena de opciones vacía para {expiration}")
+                    logger.debug("%s: Cadena de opciones vacía para %s", ticker, expiration)
                     continue
-                chain['strike_diff'] = abs(chain['strike'] - current_price)
-                atm_option = chain.loc[chain['strike_diff'].idxmin()]
+                # No se modifica la cadena: se comparte con get_option_data
+                strike_diff = (chain['strike'] - current_price).abs()
+                atm_option = chain.loc[strike_diff.idxmin()]
                 iv = atm_option.get('impliedVolatility', 0) * 100
                 # Log detallado de la opción ATM
-                logger.debug(f"Opción ATM para {expiration}: Strike ${atm_option['strike']:.2f}, IV {iv:.2f}%")
+                logger.debug("Opción ATM para %s: Strike $%.2f, IV %.2f%%", expiration, atm_option['strike'], iv)
                 if iv > 0:
                     iv_values.append(iv)
-                    logger.debug(f"{ticker}: IV de opción ATM para {expiration}: {iv:.2f}%")
+                    logger.debug("%s: IV de opción ATM para %s: %.2f%%", ticker, expiration, iv)
                 else:
-                    logger.debug(f"{ticker}: IV no válida para {expiration}: {iv}%")
+                    logger.debug("%s: IV no válida para %s: %s%%", ticker, expiration, iv)
 
         if not iv_values:
             logger.info(f"{ticker}: Descartado - No se encontraron opciones válidas para calcular IV")
@@ -85,28 +245,133 @@ def get_ticker_iv(ticker, config):
         }
     except Exception as e:
         logger.error(f"Error obteniendo IV para {ticker}: {e}")
+        if details is not None:
+            details["error"] = str(e)
         return None
 
-def get_option_data(ticker, config):
+# Columnas de los contratos seleccionados (un DataFrame por ticker o por grupo)
+CONTRACT_COLUMNS = [
+    "ticker", "strike", "expiration", "days_to_expiration", "bid", "last_price", "volume", "open_interest",
+    "rentabilidad_anual", "delta", "gamma", "theta", "vega", "prob_assignment", "net_risk",
+    "implied_volatility", "strike_distance", "previous_close",
+]
+
+def empty_contracts():
+    """
+    DataFrame vacío con las columnas de los contratos, usado cuando un ticker no tiene resultados.
+    """
+    return pd.DataFrame({column: [] for column in CONTRACT_COLUMNS})
+
+def _column(chain, name, default=0.0):
+    """
+    Devuelve una columna de la cadena como array float, o un array constante si no existe.
+    """
+    if name in chain:
+        return pd.to_numeric(chain[name], errors='coerce').to_numpy(dtype=float)
+    return np.full(len(chain), default, dtype=float)
+
+def put_chain_metrics(puts, current_price, config):
+    """
+    Columnas derivadas de una cadena de PUTs como arrays de NumPy: datos de mercado, griegas, distancia, rentabilidad y riesgo.
+
+    `puts` debe incluir las columnas `expiration` y `days_to_expiration`. Es la
+    base común del filtro de PUTs y del barrido de parámetros (sweep.py).
+    """
+    strike = _column(puts, 'strike')
+    last_price = _column(puts, 'lastPrice')
+    implied_volatility = _column(puts, 'impliedVolatility')
+    days_to_expiration = puts['days_to_expiration'].to_numpy()
+
+    # yfinance no publica griegas: se calculan con Black-Scholes para toda la cadena
+    greeks = black_scholes_greeks(current_price, strike, days_to_expiration, implied_volatility,
+                                  config["RISK_FREE_RATE"], option_type="put")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rentabilidad_anual = (last_price * 100) / current_price * (365 / days_to_expiration)
+    return {
+        "strike": strike,
+        "expiration": puts['expiration'].to_numpy(),
+        "days_to_expiration": days_to_expiration,
+        "bid": _column(puts, 'bid'),
+        "last_price": last_price,
+        "volume": _column(puts, 'volume'),
+        "open_interest": _column(puts, 'openInterest'),
+        "rentabilidad_anual": rentabilidad_anual,
+        "delta": greeks["delta"],
+        "gamma": greeks["gamma"],
+        "theta": greeks["theta"],
+        "vega": greeks["vega"],
+        "prob_assignment": greeks["prob_assignment"],
+        "net_risk": strike * 100 - last_price * 100,
+        "implied_volatility": implied_volatility * 100,
+        "strike_distance": (current_price - strike) / current_price,
+    }
+
+def filter_put_chain(puts, current_price, config, discarded_reasons):
+    """
+    Aplica todos los filtros de PUTs como máscaras booleanas sobre la cadena completa.
+
+    `puts` debe incluir las columnas `expiration` y `days_to_expiration`. Los
+    descartes se cuentan en `discarded_reasons` en el mismo orden en que se
+    aplicaban los filtros fila a fila: cada opción se atribuye al primer filtro
+    que no supera. Delta, gamma, theta, vega y probabilidad de asignación se
+    calculan para toda la cadena con Black-Scholes. Devuelve un DataFrame con
+    las opciones válidas.
+    """
+    columns = put_chain_metrics(puts, current_price, config)
+    strike, bid, last_price = columns["strike"], columns["bid"], columns["last_price"]
+    delta, days_to_expiration = columns["delta"], columns["days_to_expiration"]
+    max_risk_allowed = config["CAPITAL"] * config["MAX_RISK_PER_TRADE"]
+
+    # Las comparaciones con NaN son falsas, igual que en el filtro fila a fila:
+    # un dato ausente no descarta la opción salvo en el delta.
+    in_delta_range = (delta >= config["TARGET_DELTA_MIN"]) & (delta <= config["TARGET_DELTA_MAX"])
+    filters = [
+        ("otm", strike >= current_price),
+        ("strike_distance", columns["strike_distance"] < config["MIN_STRIKE_DISTANCE"]),
+        ("bid", bid < config["MIN_BID"]),
+        ("last_price", last_price <= 0),
+        ("last_price_too_low", last_price < 1.0),
+        ("volume", columns["volume"] < config["MIN_VOLUMEN"]),
+        ("open_interest", columns["open_interest"] < config["MIN_OPEN_INTEREST"]),
+        # Sin IV o con vencimiento de 0 días no se puede calcular el delta
+        ("delta_invalid", np.isnan(delta)),
+        ("delta", ~in_delta_range),
+        # Los vencimientos de 0 días no tienen rentabilidad anual definida
+        ("rentabilidad_anual",
+         (columns["rentabilidad_anual"] < config["MIN_RENTABILIDAD_ANUAL"]) | (days_to_expiration <= 0)),
+        ("net_risk", columns["net_risk"] > max_risk_allowed),
+    ]
+    valid = np.ones(len(puts), dtype=bool)
+    for reason, rejected in filters:
+        rejected = valid & rejected
+        discarded_reasons[reason] += int(rejected.sum())
+        valid &= ~rejected
+
+    return pd.DataFrame({name: values[valid] for name, values in columns.items()})
+
+def get_option_data(ticker, config, snapshot=None, details=None):
     """
     Obtiene datos de opciones PUT para un ticker.
+
+    Devuelve un DataFrame con una fila por contrato válido (columnas
+    CONTRACT_COLUMNS). Los errores se anotan en `details` como en get_ticker_iv.
     """
     try:
         logger.info(f"Obteniendo datos de opciones para {ticker}...")
-        stock = yf.Ticker(ticker)
-        logger.debug(f"Obteniendo precio actual de {ticker}...")
-        info = stock.info
-        current_price = info.get('regularMarketPrice', info.get('previousClose', 0))
-        previous_close = info.get('previousClose', 0)
+        if snapshot is None:
+            snapshot = TickerSnapshot(ticker)
+        current_price = snapshot.current_price
+        previous_close = snapshot.previous_close
         # Log detallado de los datos del subyacente
-        logger.debug(f"Datos del subyacente para {ticker}: Precio actual: ${current_price:.2f}, Último cierre: ${previous_close:.2f}")
+        logger.debug("Datos del subyacente para %s: Precio actual: $%.2f, Último cierre: $%.2f",
+                     ticker, current_price, previous_close)
         if current_price <= 0:
             logger.info(f"{ticker}: Descartado - Precio actual no válido: ${current_price}")
             raise ValueError(f"Precio actual de {ticker} no válido: ${current_price}")
         logger.info(f"Precio actual de {ticker}: ${current_price:.2f}, Último cierre: ${previous_close:.2f}")
 
-        expirations = stock.options
-        options_data = []
+        expirations = snapshot.expirations
         discarded_reasons = {
             "otm": 0,
             "strike_distance": 0,
@@ -122,119 +387,41 @@ def get_option_data(ticker, config):
             "days_to_expiration": 0
         }
 
-        logger.debug(f"Procesando {len(expirations)} fechas de vencimiento para opciones de {ticker}...")
+        logger.debug("Procesando %d fechas de vencimiento para opciones de %s...", len(expirations), ticker)
+        chains = []
         for expiration in expirations:
-            expiration_date = datetime.strptime(expiration, '%Y-%m-%d')
-            days_to_expiration = (expiration_date - datetime.now()).days
+            days_to_expiration = snapshot.days_to_expiration(expiration)
             if days_to_expiration > config["MAX_DIAS_VENCIMIENTO"]:
-                logger.debug(f"Expiración {expiration} descartada: {days_to_expiration} días (excede el máximo de {config['MAX_DIAS_VENCIMIENTO']})")
+                logger.debug("Expiración %s descartada: %d días (excede el máximo de %s)",
+                             expiration, days_to_expiration, config['MAX_DIAS_VENCIMIENTO'])
                 discarded_reasons["days_to_expiration"] += 1
                 continue
 
-            logger.debug(f"Procesando opciones para {ticker} con vencimiento {expiration} ({days_to_expiration} días)")
-            opt = stock.option_chain(expiration)
-            chain = opt.puts
-            logger.debug(f"Se encontraron {len(chain)} opciones PUT para {expiration}")
-            for _, row in chain.iterrows():
-                strike = row['strike']
-                bid = row.get('bid', 0)
-                last_price = row.get('lastPrice', 0)
-                volume = row.get('volume', 0) or 0
-                open_interest = row.get('openInterest', 0) or 0
-                delta = row.get('delta', 0)
-                iv = row.get('impliedVolatility', 0) * 100
-
-                # Log detallado de los datos de la opción
-                logger.debug(f"Evaluando opción: Strike ${strike:.2f}, Bid ${bid:.2f}, Last Price ${last_price:.2f}, Volume {volume}, Open Interest {open_interest}, Delta {delta:.2f}, IV {iv:.2f}%")
-
-                # Filtrar opciones OTM
-                if strike >= current_price:
-                    logger.debug(f"Opción descartada: Strike ${strike:.2f} >= Precio actual ${current_price:.2f} (no es OTM)")
-                    discarded_reasons["otm"] += 1
-                    continue
-
-                # Filtrar strike al menos 5% por debajo del precio actual
-                strike_distance = (current_price - strike) / current_price
-                if strike_distance < config["MIN_STRIKE_DISTANCE"]:
-                    logger.debug(f"Opción descartada: Distancia del strike {strike_distance*100:.2f}% < {config['MIN_STRIKE_DISTANCE']*100}%")
-                    discarded_reasons["strike_distance"] += 1
-                    continue
-
-                # Filtros básicos
-                if bid < config["MIN_BID"]:
-                    logger.debug(f"Opción descartada: Bid ${bid:.2f} < {config['MIN_BID']}")
-                    discarded_reasons["bid"] += 1
-                    continue
-                if last_price <= 0:
-                    logger.debug(f"Opción descartada: Último precio ${last_price:.2f} <= 0")
-                    discarded_reasons["last_price"] += 1
-                    continue
-                if last_price < 1.0:
-                    logger.debug(f"Opción descartada: Prima ${last_price:.2f} < $1.00")
-                    discarded_reasons["last_price_too_low"] += 1
-                    continue
-                if volume < config["MIN_VOLUMEN"]:
-                    logger.debug(f"Opción descartada: Volumen {volume} < {config['MIN_VOLUMEN']}")
-                    discarded_reasons["volume"] += 1
-                    continue
-                if open_interest < config["MIN_OPEN_INTEREST"]:
-                    logger.debug(f"Opción descartada: Interés abierto {open_interest} < {config['MIN_OPEN_INTEREST']}")
-                    discarded_reasons["open_interest"] += 1
-                    continue
-                # Comentamos el filtro de delta no válido
-                # if delta == 0 or delta is None:
-                #     logger.debug(f"Opción descartada: Delta no válido: {delta}")
-                #     discarded_reasons["delta_invalid"] += 1
-                #     continue
-                # Ajustamos el filtro de rango de delta para que no descarte si delta es 0
-                if delta != 0 and not (config["TARGET_DELTA_MIN"] <= delta <= config["TARGET_DELTA_MAX"]):
-                    logger.debug(f"Opción descartada: Delta {delta:.2f} fuera del rango {config['TARGET_DELTA_MIN']} a {config['TARGET_DELTA_MAX']}")
-                    discarded_reasons["delta"] += 1
-                    continue
-
-                # Calcular rentabilidad
-                rentabilidad_diaria = (last_price * 100) / current_price
-                rentabilidad_anual = rentabilidad_diaria * (365 / days_to_expiration)
-                if rentabilidad_anual < config["MIN_RENTABILIDAD_ANUAL"]:
-                    logger.debug(f"Opción descartada: Rentabilidad anual {rentabilidad_anual:.2f}% < {config['MIN_RENTABILIDAD_ANUAL']}%")
-                    discarded_reasons["rentabilidad_anual"] += 1
-                    continue
-
-                # Calcular riesgo
-                max_loss = strike * 100
-                premium_received = last_price * 100
-                net_risk = max_loss - premium_received
-                max_risk_allowed = config["CAPITAL"] * config["MAX_RISK_PER_TRADE"]
-                if net_risk > max_risk_allowed:
-                    logger.debug(f"Opción descartada: Riesgo neto ${net_risk:.2f} > ${max_risk_allowed:.2f}")
-                    discarded_reasons["net_risk"] += 1
-                    continue
+            chain, _ = snapshot.option_chain(expiration)
+            logger.debug("Se encontraron %d opciones PUT para %s (%d días)", len(chain), expiration, days_to_expiration)
+            if chain.empty:
+                continue
+            chains.append(chain.assign(expiration=expiration, days_to_expiration=days_to_expiration))
 
-                logger.debug(f"Opción válida encontrada: Strike ${strike:.2f}, Rentabilidad anual {rentabilidad_anual:.2f}%, Delta {delta:.2f}, IV {iv:.2f}%")
-                options_data.append({
-                    "ticker": ticker,
-                    "strike": strike,
-                    "expiration": expiration,
-                    "days_to_expiration": days_to_expiration,
-                    "bid": bid,
-                    "last_price": last_price,
-                    "volume": volume,
-                    "open_interest": open_interest,
-                    "rentabilidad_anual": rentabilidad_anual,
-                    "delta": delta,
-                    "net_risk": net_risk,
-                    "implied_volatility": iv,
-                    "strike_distance": strike_distance,
-                    "previous_close": previous_close
-                })
+        options_data = empty_contracts()
+        if chains:
+            with metrics.timed("filter", ticker):
+                valid = filter_put_chain(pd.concat(chains, ignore_index=True), current_price, config, discarded_reasons)
+            valid.insert(0, "ticker", ticker)
+            valid["previous_close"] = previous_close
+            options_data = valid
 
         logger.info(f"Se encontraron {len(options_data)} opciones válidas para {ticker}")
         # Log detallado de los motivos de descarte
-        logger.debug(f"Resumen de descartes para {ticker}:")
-        for reason, count in discarded_reasons.items():
-            if count > 0:
-                logger.debug(f"  - {reason}: {count} opciones descartadas")
+        metrics.add_discards(discarded_reasons)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Resumen de descartes para %s:", ticker)
+            for reason, count in discarded_reasons.items():
+                if count > 0:
+                    logger.debug("  - %s: %d opciones descartadas", reason, count)
         return options_data
     except Exception as e:
         logger.error(f"Error obteniendo datos para {ticker}: {e}")
-        return []
+        if details is not None:
+            details["error"] = str(e)
+        return empty_contracts()
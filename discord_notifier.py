@@ -1,60 +1,306 @@
 # discord_notifier.py
-import requests
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import metrics
 
-# Configurar logging para mostrar en consola
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def send_discord_notification(best_contracts_by_ticker, webhook_url, group_description):
+# Discord tiene un límite de 2000 caracteres por mensaje
+DISCORD_MESSAGE_LIMIT = 2000
+DISCORD_MAX_RETRIES = 5
+DISCORD_BACKOFF_SECONDS = 1.0
+
+# Sesión HTTP compartida (conexiones reutilizadas) y pool para envíos en segundo plano
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="discord")
+_pending = []
+_webhook_locks = {}
+
+def _get_session():
+    global _session
+    # requests se importa al primer envío para no penalizar el arranque
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        return _session
+
+def _webhook_lock(webhook_url):
+    # Los mensajes de un mismo webhook se envían en orden; webhooks distintos, en paralelo
+    with _session_lock:
+        return _webhook_locks.setdefault(webhook_url, threading.Lock())
+
+def format_contract_line(contract):
+    return (f"- Strike: ${contract['strike']:.2f} | "
+            f"Vencimiento: {contract['expiration']} ({contract['days_to_expiration']} días) | "
+            f"Prima: ${contract['last_price']:.2f} (Bid: ${contract['bid']:.2f}) | "
+            f"Rent. Anual: {contract['rentabilidad_anual']:.2f}% | "
+            f"Delta: {contract['delta']:.2f} | "
+            f"P. Asignación: {contract['prob_assignment']*100:.0f}% | "
+            f"IV: {contract['implied_volatility']:.2f}% | "
+            f"Distancia: {contract['strike_distance']*100:.2f}% | "
+            f"Riesgo: ${contract['net_risk']:.2f}")
+
+def _records(contracts):
+    # Los resultados se guardan en DataFrames; solo se convierten a dicts los contratos que se muestran.
+    # Se construyen columna a columna porque DataFrame.to_dict("records") es mucho más lento.
+    if not hasattr(contracts, "columns"):
+        return contracts
+    columns = list(contracts.columns)
+    return [dict(zip(columns, row)) for row in zip(*(contracts[column].tolist() for column in columns))]
+
+def format_ticker_block(ticker, contracts):
+    """
+    Devuelve el bloque de texto de un ticker: cabecera con el último cierre y una línea por contrato.
+    """
+    contracts = _records(contracts)
+    # Todos los contratos del ticker tienen el mismo previous_close
+    previous_close = contracts[0]["previous_close"]
+    lines = [f"**{ticker}** (Último Cierre: ${previous_close:.2f}):"]
+    lines.extend(format_contract_line(contract) for contract in contracts)
+    return "\n".join(lines)
+
+def format_global_block(global_top):
+    """
+    Bloque con los mejores contratos del grupo entre todos los tickers.
+    """
+    contracts = _records(global_top)
+    lines = [f"**Top {len(contracts)} global:**"]
+    lines.extend(f"{contract['ticker']} {format_contract_line(contract)}" for contract in contracts)
+    return "\n".join(lines)
+
+def pack_messages(header, blocks, limit=DISCORD_MESSAGE_LIMIT):
+    """
+    Agrupa bloques completos en el menor número de mensajes que respetan `limit`.
+
+    Un bloque solo se parte (por líneas) si por sí solo no cabe en un mensaje.
     """
-    Envía notificaciones a Discord con los mejores contratos por ticker.
+    messages = []
+    current = [header] if header else []
+    size = len(header) if header else 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            messages.append("\n".join(current))
+        current, size = [], 0
+
+    for block in blocks:
+        pieces = [block] if len(block) <= limit else block.split("\n")
+        for piece in pieces:
+            piece = piece[:limit]
+            # Separación de una línea en blanco entre bloques
+            separator = 2 if current else 0
+            if size + separator + len(piece) > limit:
+                flush()
+                separator = 0
+            if separator:
+                current.append("")
+            current.append(piece)
+            size += separator + len(piece)
+    flush()
+    return messages
+
+def build_messages(best_contracts_by_ticker, group_description, global_top=None):
+    """
+    Construye los mensajes de Discord para los mejores contratos de un grupo.
+
+    Si se indica `global_top`, el ranking global se muestra antes del detalle por ticker.
+    """
+    blocks = [format_ticker_block(ticker, contracts)
+              for ticker, contracts in best_contracts_by_ticker.items() if len(contracts)]
+    if blocks and global_top is not None and len(global_top):
+        blocks.insert(0, format_global_block(global_top))
+    if not blocks:
+        return [f"No se encontraron contratos para {group_description}."]
+    return pack_messages(f"Mejores contratos para {group_description}:", blocks)
+
+def _retry_delay(response, attempt):
+    """
+    Segundos de espera antes de reintentar, según las cabeceras de Discord o con backoff exponencial.
+    """
+    if response is not None and response.status_code == 429:
+        try:
+            return float(response.json().get("retry_after"))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return DISCORD_BACKOFF_SECONDS * (2 ** attempt)
+
+def post_message(webhook_url, content):
+    """
+    Envía un mensaje al webhook respetando los límites de Discord y reintentando con backoff.
+    """
+    import requests
+    session = _get_session()
+    for attempt in range(DISCORD_MAX_RETRIES + 1):
+        response = None
+        try:
+            metrics.increment("requests.discord")
+            metrics.increment("bytes.discord", len(content.encode("utf-8")))
+            response = session.post(webhook_url, json={"content": content}, timeout=30)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                # Si se ha agotado el cupo del bucket, esperar a que se reponga
+                if response.headers.get("X-RateLimit-Remaining") == "0":
+                    time.sleep(float(response.headers.get("X-RateLimit-Reset-After", 0)))
+                return
+            error = f"HTTP {response.status_code}"
+        except requests.HTTPError:
+            raise
+        except requests.RequestException as e:
+            error = str(e)
+        if attempt == DISCORD_MAX_RETRIES:
+            raise RuntimeError(f"Discord no aceptó el mensaje tras {attempt + 1} intentos: {error}")
+        delay = _retry_delay(response, attempt)
+        logger.warning(f"Discord: {error}, reintentando en {delay:.1f}s ({attempt + 1}/{DISCORD_MAX_RETRIES})")
+        time.sleep(delay)
+
+def _deliver(messages, webhook_url, group_description):
+    try:
+        with _webhook_lock(webhook_url), metrics.timed("notify"):
+            for i, msg in enumerate(messages):
+                logger.debug("Enviando mensaje %d/%d a Discord: %s...", i + 1, len(messages), msg[:100])
+                post_message(webhook_url, msg)
+                logger.info(f"Mensaje {i+1}/{len(messages)} enviado a Discord")
+        logger.info(f"Notificación completada exitosamente para {group_description}")
+    except Exception as e:
+        logger.error(f"Error enviando notificación a Discord: {e}")
+
+def send_discord_notification(best_contracts_by_ticker, webhook_url, group_description, background=False,
+                              global_top=None):
+    """
+    Envía notificaciones a Discord con los mejores contratos por ticker y, opcionalmente, el ranking global.
+
+    Con `background=True` el envío se hace en un hilo aparte y se devuelve el
+    Future; `wait_for_notifications` espera a que terminen todos los envíos.
     """
     try:
         if not webhook_url or webhook_url == "URL_POR_DEFECTO":
             logger.error(f"Error: Webhook inválido: {webhook_url}")
-            return
+            return None
 
         total_contracts = sum(len(contracts) for contracts in best_contracts_by_ticker.values())
         logger.info(f"Enviando notificación a Discord para {group_description}: {total_contracts} contratos encontrados")
 
-        if not best_contracts_by_ticker or total_contracts == 0:
-            message = f"No se encontraron contratos para {group_description}."
-            payload = {"content": message}
-            logger.debug(f"Enviando mensaje a Discord: {message}")
-            requests.post(webhook_url, json=payload)
-            logger.info("Notificación enviada a Discord (sin contratos)")
+        messages = build_messages(best_contracts_by_ticker, group_description, global_top)
+        if not background:
+            _deliver(messages, webhook_url, group_description)
+            return None
+        future = _executor.submit(_deliver, messages, webhook_url, group_description)
+        _pending.append(future)
+        return future
+    except Exception as e:
+        logger.error(f"Error enviando notificación a Discord: {e}")
+        return None
+
+class StreamingNotifier:
+    """
+    Envía a Discord los contratos de cada ticker a medida que se analizan.
+
+    Los bloques se encolan con `add` (cola acotada a `max_pending` bloques) y
+    un hilo dedicado los agrupa en mensajes: un mensaje se envía en cuanto está
+    lleno o cuando han pasado `flush_interval` segundos desde el primer bloque
+    pendiente. `close` envía lo que quede y un resumen final con el ranking
+    global del grupo.
+    """
+    _CLOSE = object()
+
+    def __init__(self, webhook_url, group_description, flush_interval=30.0, limit=DISCORD_MESSAGE_LIMIT,
+                 max_pending=100):
+        self.webhook_url = webhook_url
+        self.group_description = group_description
+        self.flush_interval = flush_interval
+        self.limit = limit
+        self.sent_messages = 0
+        self.added_blocks = 0
+        self.enabled = bool(webhook_url) and webhook_url != "URL_POR_DEFECTO"
+        if not self.enabled:
+            logger.error(f"Error: Webhook inválido: {webhook_url}")
             return
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="discord-stream", daemon=True)
+        self._thread.start()
 
-        message = f"Mejores contratos para {group_description}:\n"
-        for ticker, contracts in best_contracts_by_ticker.items():
-            if not contracts:
-                continue
-            # Obtener el precio del último cierre del primer contrato (todos los contratos del ticker tienen el mismo previous_close)
-            previous_close = contracts[0]["previous_close"] if contracts else 0
-            message += f"\n**{ticker}** (Último Cierre: ${previous_close:.2f}):\n"
-            for contract in contracts:
-                message += (f"- Strike: ${contract['strike']:.2f} | "
-                           f"Vencimiento: {contract['expiration']} ({contract['days_to_expiration']} días) | "
-                           f"Prima: ${contract['last_price']:.2f} (Bid: ${contract['bid']:.2f}) | "
-                           f"Rent. Anual: {contract['rentabilidad_anual']:.2f}% | "
-                           f"Delta: {contract['delta']:.2f} | "
-                           f"IV: {contract['implied_volatility']:.2f}% | "
-                           f"Distancia: {contract['strike_distance']*100:.2f}% | "
-                           f"Riesgo: ${contract['net_risk']:.2f}\n")
-
-        # Discord tiene un límite de 2000 caracteres por mensaje
-        if len(message) > 2000:
-            messages = [message[i:i+1900] for i in range(0, len(message), 1900)]
+    def add(self, ticker, contracts):
+        """
+        Encola el bloque de un ticker; los tickers sin contratos no generan mensaje.
+        """
+        if self.enabled and len(contracts):
+            self.added_blocks += 1
+            self._queue.put(format_ticker_block(ticker, contracts))
+
+    def close(self, global_top=None, summary=None, timeout=None):
+        """
+        Envía los bloques pendientes y el resumen final, y espera a que termine el hilo de envío.
+        """
+        if not self.enabled:
+            return
+        if self.added_blocks == 0:
+            final = [f"No se encontraron contratos para {self.group_description}."]
         else:
-            messages = [message]
-
-        for i, msg in enumerate(messages):
-            payload = {"content": msg}
-            logger.debug(f"Enviando mensaje {i+1}/{len(messages)} a Discord: {msg[:100]}...")
-            response = requests.post(webhook_url, json=payload)
-            response.raise_for_status()
-            logger.info(f"Mensaje {i+1}/{len(messages)} enviado a Discord")
-        logger.info("Notificación completada exitosamente")
-    except Exception as e:
-        logger.error(f"Error enviando notificación a Discord: {e}")
+            final = [f"Resumen para {self.group_description}: {summary}" if summary
+                     else f"Resumen para {self.group_description}"]
+            if global_top is not None and len(global_top):
+                final.append(format_global_block(global_top))
+        self._queue.put((self._CLOSE, final))
+        self._thread.join(timeout)
+
+    def _send(self, blocks, header=None):
+        messages = pack_messages(header, blocks, self.limit)
+        try:
+            with _webhook_lock(self.webhook_url), metrics.timed("notify"):
+                for msg in messages:
+                    post_message(self.webhook_url, msg)
+                    self.sent_messages += 1
+                    logger.info(f"Mensaje {self.sent_messages} enviado a Discord para {self.group_description}")
+        except Exception as e:
+            logger.error(f"Error enviando notificación a Discord: {e}")
+
+    def _run(self):
+        pending, size, deadline = [], 0, None
+        header = f"Mejores contratos para {self.group_description}:"
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, tuple) and item[0] is self._CLOSE:
+                if pending:
+                    self._send(pending, header if self.sent_messages == 0 else None)
+                # El resumen va en un mensaje aparte para que no quede mezclado con los bloques
+                self._send(item[1])
+                logger.info(f"Notificación completada exitosamente para {self.group_description}")
+                return
+            if item is not None:
+                # Si el bloque no cabe en el mensaje actual, se envía lo acumulado y se empieza otro
+                if pending and size + 2 + len(item) > self.limit:
+                    self._send(pending, header if self.sent_messages == 0 else None)
+                    pending, size, deadline = [], 0, None
+                if not pending:
+                    size = len(header) if self.sent_messages == 0 else 0
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+                size += 2 + len(item)
+            if pending and (item is None or time.monotonic() >= deadline):
+                self._send(pending, header if self.sent_messages == 0 else None)
+                pending, size, deadline = [], 0, None
+
+def wait_for_notifications(timeout=None):
+    """
+    Espera a que terminen los envíos en segundo plano pendientes.
+    """
+    while _pending:
+        _pending.pop(0).result(timeout=timeout)
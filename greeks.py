@@ -0,0 +1,74 @@
+# greeks.py
+import numpy as np
+
+# Griegas de Black-Scholes (sin dividendos) calculadas con NumPy sobre cadenas
+# completas en una sola pasada. Las entradas son arrays (o escalares) que se
+# combinan por broadcasting.
+
+_SQRT_2 = np.sqrt(2.0)
+_INV_SQRT_2PI = 1.0 / np.sqrt(2.0 * np.pi)
+
+def _erf(x):
+    """
+    Función de error vectorizada (Abramowitz y Stegun 7.1.26, error < 1.5e-7).
+    """
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-x * x))
+
+def norm_cdf(x):
+    return 0.5 * (1.0 + _erf(x / _SQRT_2))
+
+def norm_pdf(x):
+    return _INV_SQRT_2PI * np.exp(-0.5 * x * x)
+
+def black_scholes_greeks(spot, strike, days_to_expiration, implied_volatility, rate, option_type="put"):
+    """
+    Calcula delta, gamma, theta, vega y probabilidad de asignación para un array de contratos.
+
+    `implied_volatility` es decimal (0.35 = 35%) y `rate` es el tipo libre de
+    riesgo anual en decimal. Theta se expresa por día natural y vega por punto
+    de volatilidad. La probabilidad de asignación es la probabilidad
+    (neutral al riesgo) de que la opción venza dentro del dinero. Los contratos
+    sin IV, strike o plazo válidos devuelven NaN. Devuelve un dict de arrays.
+    """
+    spot = np.asarray(spot, dtype=float)
+    strike = np.asarray(strike, dtype=float)
+    sigma = np.asarray(implied_volatility, dtype=float)
+    t = np.asarray(days_to_expiration, dtype=float) / 365.0
+
+    valid = (spot > 0) & (strike > 0) & (sigma > 0) & (t > 0)
+    # Se sustituyen las entradas inválidas para evitar avisos y se marcan como NaN al final
+    spot_v = np.where(valid, spot, 1.0)
+    strike_v = np.where(valid, strike, 1.0)
+    sigma_v = np.where(valid, sigma, 1.0)
+    t_v = np.where(valid, t, 1.0)
+
+    sqrt_t = np.sqrt(t_v)
+    sigma_sqrt_t = sigma_v * sqrt_t
+    d1 = (np.log(spot_v / strike_v) + (rate + 0.5 * sigma_v * sigma_v) * t_v) / sigma_sqrt_t
+    d2 = d1 - sigma_sqrt_t
+    pdf_d1 = norm_pdf(d1)
+    discounted_strike = strike_v * np.exp(-rate * t_v)
+
+    gamma = pdf_d1 / (spot_v * sigma_sqrt_t)
+    vega = spot_v * pdf_d1 * sqrt_t / 100.0
+    time_decay = -spot_v * pdf_d1 * sigma_v / (2.0 * sqrt_t)
+    if option_type == "put":
+        delta = norm_cdf(d1) - 1.0
+        theta = (time_decay + rate * discounted_strike * norm_cdf(-d2)) / 365.0
+        prob_assignment = norm_cdf(-d2)
+    elif option_type == "call":
+        delta = norm_cdf(d1)
+        theta = (time_decay - rate * discounted_strike * norm_cdf(d2)) / 365.0
+        prob_assignment = norm_cdf(d2)
+    else:
+        raise ValueError(f"Tipo de opción no válido: {option_type}")
+
+    return {
+        name: np.where(valid, values, np.nan)
+        for name, values in (("delta", delta), ("gamma", gamma), ("theta", theta), ("vega", vega),
+                             ("prob_assignment", prob_assignment))
+    }
@@ -0,0 +1,127 @@
+# instrumentation.py
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+class RunMetrics:
+    """
+    Tiempos por etapa y por ticker, contadores y descartes agregados de una ejecución.
+
+    Es seguro entre hilos. Las etapas y los descartes se agregan también por
+    grupo (el grupo activo se fija con `start_group`, ya que los grupos se
+    procesan de uno en uno). `report()` devuelve un dict serializable a JSON.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._start = time.perf_counter()
+            self.current_group = None
+            self.stages = {}
+            self.tickers = {}
+            self.counters = {}
+            self.groups = {}
+
+    def start_group(self, group_name):
+        with self._lock:
+            self.current_group = group_name
+            self.groups.setdefault(group_name, {"stages": {}, "discarded_reasons": {}, "counters": {}})
+
+    @staticmethod
+    def _add_stage(stages, stage, elapsed):
+        entry = stages.setdefault(stage, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        entry["count"] += 1
+        entry["total_seconds"] += elapsed
+        entry["max_seconds"] = max(entry["max_seconds"], elapsed)
+
+    def record(self, stage, elapsed, ticker=None):
+        """
+        Registra `elapsed` segundos en la etapa `stage` (y en el ticker, si se indica).
+        """
+        with self._lock:
+            self._add_stage(self.stages, stage, elapsed)
+            if self.current_group is not None:
+                self._add_stage(self.groups[self.current_group]["stages"], stage, elapsed)
+            if ticker is not None:
+                ticker_stages = self.tickers.setdefault(ticker, {})
+                ticker_stages[stage] = ticker_stages.get(stage, 0.0) + elapsed
+
+    @contextmanager
+    def timed(self, stage, ticker=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, ticker)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if self.current_group is not None:
+                group_counters = self.groups[self.current_group]["counters"]
+                group_counters[name] = group_counters.get(name, 0) + amount
+
+    def add_discards(self, discarded_reasons):
+        """
+        Suma los motivos de descarte de un ticker al total del grupo activo.
+        """
+        with self._lock:
+            key = self.current_group if self.current_group is not None else "_sin_grupo"
+            totals = self.groups.setdefault(key, {"stages": {}, "discarded_reasons": {}, "counters": {}})["discarded_reasons"]
+            for reason, count in discarded_reasons.items():
+                totals[reason] = totals.get(reason, 0) + count
+
+    def merge(self, report):
+        """
+        Suma al grupo activo las etapas, contadores y descartes de otro informe (por ejemplo, de un subproceso).
+        """
+        with self._lock:
+            key = self.current_group if self.current_group is not None else "_sin_grupo"
+            group = self.groups.setdefault(key, {"stages": {}, "discarded_reasons": {}, "counters": {}})
+            for stage, entry in report.get("stages", {}).items():
+                for stages in (self.stages, group["stages"]):
+                    total = stages.setdefault(stage, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+                    total["count"] += entry["count"]
+                    total["total_seconds"] += entry["total_seconds"]
+                    total["max_seconds"] = max(total["max_seconds"], entry["max_seconds"])
+            for name, amount in report.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+                group["counters"][name] = group["counters"].get(name, 0) + amount
+            for sub_group in report.get("groups", {}).values():
+                for reason, count in sub_group.get("discarded_reasons", {}).items():
+                    group["discarded_reasons"][reason] = group["discarded_reasons"].get(reason, 0) + count
+
+    def report(self, extra=None):
+        with self._lock:
+            return json.loads(json.dumps({
+                "started_at": self.started_at.isoformat(),
+                "wall_seconds": time.perf_counter() - self._start,
+                "stages": self.stages,
+                "counters": self.counters,
+                "groups": self.groups,
+                "tickers": self.tickers,
+                **(extra or {}),
+            }, default=str))
+
+    def write_report(self, path, extra=None):
+        """
+        Escribe el informe JSON de la ejecución en `path`; `extra` añade secciones al informe.
+        """
+        report = self.report(extra)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        logger.info(f"Informe de ejecución escrito en {path} ({report['wall_seconds']:.1f}s)")
+        return report
+
+# Métricas de la ejecución en curso, compartidas por todos los módulos
+metrics = RunMetrics()
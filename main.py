@@ -2,64 +2,319 @@
 import logging
 import sys
 import traceback
-from config import GROUPS_CONFIG
-from option_analyzer import analyze_ticker
-from discord_notifier import send_discord_notification
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+# Los ajustes se leen como atributos de `settings` en cada uso para que el modo
+# daemon pueda recargar config.py sin reiniciar el proceso
+import config as settings
+from option_analyzer import analyze_ticker, prescreen_tickers, rank_global
+from discord_notifier import StreamingNotifier, send_discord_notification, wait_for_notifications
+import data_fetcher
+from data_fetcher import SnapshotStore, empty_contracts, market_cache
+from instrumentation import metrics
+from providers import prune_archive
+from state import ScanState, config_fingerprint, inputs_fingerprint
 
 # Configurar logging para mostrar en consola
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_group(group_name, group_config):
+def _iter_parallel(function, items, max_workers=None):
+    """
+    Aplica `function` a cada elemento en un pool de hilos y va devolviendo los resultados en el orden de `items`.
+
+    Como mucho hay 2 * max_workers tareas en vuelo, de modo que la memoria no
+    crece con el número de elementos y el primer resultado llega en cuanto
+    termina el primer elemento.
+    """
+    if max_workers is None:
+        max_workers = settings.MAX_WORKERS
+    if max_workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ticker") as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _parallel_map(function, items, max_workers=None):
+    """
+    Aplica `function` a cada elemento en un pool de hilos, conservando el orden de `items`.
+    """
+    return list(_iter_parallel(function, items, max_workers))
+
+def _safe_analyze_ticker(ticker, config, snapshots=None, details=None):
+    """
+    Analiza un ticker aislando cualquier fallo para que no afecte al resto del grupo.
+    """
+    try:
+        snapshot = snapshots.get(ticker) if snapshots is not None else None
+        return analyze_ticker(ticker, config, snapshot, details)
+    except Exception as e:
+        logger.error(f"Error inesperado analizando {ticker}: {e}")
+        if details is not None:
+            details["error"] = str(e)
+        return empty_contracts()
+
+def iter_analyze_tickers(tickers, config, snapshots=None, details=None, max_workers=None):
+    """
+    Analiza los tickers en paralelo y va devolviendo los resultados en el mismo orden que `tickers`.
+
+    `details`, si se indica, es un dict ticker -> dict que se rellena con los datos del subyacente.
+    """
+    return _iter_parallel(
+        lambda ticker: _safe_analyze_ticker(ticker, config, snapshots, details[ticker] if details else None),
+        tickers, max_workers)
+
+def analyze_tickers(tickers, config, snapshots=None, details=None, max_workers=None):
+    """
+    Analiza los tickers en paralelo y devuelve la lista de resultados en el mismo orden que `tickers`.
+    """
+    return list(iter_analyze_tickers(tickers, config, snapshots, details, max_workers))
+
+def _spot_price(ticker, quotes, snapshot):
+    quote = quotes.get(ticker)
+    return quote["price"] if quote else snapshot.current_price
+
+def fetch_quotes(tickers):
+    """
+    Cotización masiva de `tickers` (ver MarketDataProvider.get_quotes); dict vacío si falla.
+    """
+    try:
+        with metrics.timed("quotes_fetch"):
+            return data_fetcher.market_provider.get_quotes(tickers)
+    except Exception as e:
+        logger.error(f"Error en la cotización masiva: {e}")
+        return {}
+
+def find_unchanged_tickers(groups, selected_by_group, snapshots, quotes, state):
+    """
+    Devuelve dict grupo -> {ticker: contratos} con los tickers que se pueden reutilizar del estado anterior.
+
+    Solo consulta la cotización masiva y la lista de vencimientos, nunca las cadenas (ver ScanState).
+    """
+    now = data_fetcher.market_provider.now()
+    config_hashes = {name: config_fingerprint(group["config"]) for name, group in groups.items()}
+    candidates = list(dict.fromkeys(ticker for name, selected in selected_by_group.items()
+                                    for ticker in selected if state.entry(name, ticker) is not None))
+
+    def check(ticker):
+        unchanged = {}
+        try:
+            snapshot = snapshots.get(ticker)
+            spot = _spot_price(ticker, quotes, snapshot)
+            for name, group in groups.items():
+                if ticker in selected_by_group[name] and state.entry(name, ticker) is not None:
+                    fingerprint = inputs_fingerprint(snapshot, group["config"]["MAX_DIAS_VENCIMIENTO"])
+                    if state.is_unchanged(name, ticker, spot, fingerprint, config_hashes[name], now):
+                        unchanged[name] = state.reusable_contracts(name, ticker, now, group["config"])
+        except Exception as e:
+            logger.warning(f"{ticker}: No se pudo comprobar si ha cambiado, se re-evaluará: {e}")
+        return unchanged
+
+    reused = {name: {} for name in groups}
+    for ticker, unchanged in zip(candidates, _parallel_map(check, candidates)):
+        for name, contracts in unchanged.items():
+            reused[name][ticker] = contracts
+    return reused
+
+def prefetch_groups(groups, state=None, prefetch_chains=True):
+    """
+    Descarga una sola vez los datos que necesitan todos los grupos.
+
+    Se construye la unión de tickers de todos los grupos, se pide una única
+    cotización masiva y, para cada ticker que supera el pre-filtro de algún
+    grupo, se descargan las cadenas hasta el mayor MAX_DIAS_VENCIMIENTO de
+    esos grupos. Devuelve (snapshots, quotes, reused) para pasarlos a
+    process_group, de modo que evaluar un grupo adicional solo cuesta CPU.
+
+    Con `state` (re-escaneo incremental), los tickers sin cambios desde la
+    ejecución anterior no se descargan: sus contratos se devuelven en
+    `reused` (dict grupo -> {ticker: contratos}). Con `prefetch_chains=False`
+    (modo streaming) las cadenas no se precargan: cada ticker las descarga al
+    analizarse, para no mantener todo el universo en memoria.
+    """
+    all_tickers = list(dict.fromkeys(ticker for group in groups.values() for ticker in group["tickers"]))
+    quotes = fetch_quotes(all_tickers)
+
+    selected_by_group = {name: prescreen_tickers(group["tickers"], group["config"], quotes)
+                         for name, group in groups.items()}
+    # La información del subyacente sale de la cotización: solo se piden vencimientos y cadenas
+    snapshots = SnapshotStore(quotes=quotes)
+    reused = {name: {} for name in groups}
+    if state is not None:
+        with metrics.timed("incremental_check"):
+            reused = find_unchanged_tickers(groups, selected_by_group, snapshots, quotes, state)
+        total_reused = sum(len(tickers) for tickers in reused.values())
+        metrics.increment("tickers.reused", total_reused)
+        logger.info(f"Re-escaneo incremental: {total_reused} evaluaciones reutilizadas de la ejecución anterior")
+
+    horizons = {}
+    for name, group in groups.items():
+        max_days = group["config"]["MAX_DIAS_VENCIMIENTO"]
+        for ticker in selected_by_group[name]:
+            if ticker not in reused[name]:
+                horizons[ticker] = max(horizons.get(ticker, 0), max_days)
+
+    if prefetch_chains:
+        logger.info(f"Precargando datos de {len(horizons)}/{len(all_tickers)} tickers para {len(groups)} grupos...")
+        with metrics.timed("prefetch"):
+            _parallel_map(lambda ticker: snapshots.get(ticker).prefetch(horizons[ticker]), list(horizons))
+    return snapshots, quotes, reused
+
+def _update_state(state, group_name, ticker, config, snapshot, quotes, details, contracts):
+    try:
+        state.update(group_name, ticker, _spot_price(ticker, quotes, snapshot), details.get("implied_volatility"),
+                     inputs_fingerprint(snapshot, config["MAX_DIAS_VENCIMIENTO"]), config_fingerprint(config),
+                     contracts, data_fetcher.market_provider.now())
+    except Exception as e:
+        logger.warning(f"{ticker}: No se pudo guardar el estado incremental: {e}")
+
+def process_group(group_name, group_config, snapshots=None, quotes=None, reused=None, state=None,
+                  stream=None, release_tickers=None):
     """
     Procesa un grupo de tickers y envía notificaciones a Discord.
+
+    `snapshots`, `quotes` y `reused` (de prefetch_groups) permiten reutilizar
+    los datos ya descargados para otros grupos y los resultados de tickers sin
+    cambios. Si se pasa `state`, se actualiza con los tickers evaluados.
+
+    Con `stream=True` (por defecto, STREAM_NOTIFICATIONS) los contratos se
+    envían a Discord a medida que se analizan los tickers (StreamingNotifier)
+    y al final se envía un resumen con el ranking global; el grupo no acumula
+    los resultados en memoria. Los snapshots de `release_tickers` se liberan
+    en cuanto se han analizado.
     """
+    if stream is None:
+        stream = settings.STREAM_NOTIFICATIONS
     try:
         logger.info(f"Procesando grupo: {group_name}")
+        metrics.start_group(group_name)
         tickers = group_config["tickers"]
         description = group_config["description"]
         webhook_url = group_config["webhook"]
         config = group_config["config"]
 
-        logger.info(f"Total de tickers a procesar: {len(tickers)}")
+        logger.info(f"Total de tickers a procesar: {len(tickers)} ({settings.MAX_WORKERS} hilos)")
         best_contracts_by_ticker = {}
         processed_tickers = 0
         tickers_with_contracts = 0
 
-        for ticker in tickers:
-            logger.info(f"Procesando ticker {ticker} ({processed_tickers + 1}/{len(tickers)})...")
-            options = analyze_ticker(ticker, config)
-            best_contracts_by_ticker[ticker] = options
+        # Los filtros de precio y volumen del subyacente se aplican en bloque antes de descargar opciones
+        if quotes is None:
+            quotes = fetch_quotes(tickers)
+        with metrics.timed("prescreen"):
+            selected_tickers = prescreen_tickers(tickers, config, quotes)
+        metrics.increment("tickers.total", len(tickers))
+        metrics.increment("tickers.prescreened", len(selected_tickers))
+        reused = reused or {}
+        release_tickers = release_tickers or set()
+        if snapshots is None:
+            snapshots = SnapshotStore(quotes=quotes)
+        to_analyze = [ticker for ticker in selected_tickers if ticker not in reused]
+        details = {ticker: {} for ticker in to_analyze}
+        analyzed = iter_analyze_tickers(to_analyze, config, snapshots, details)
+        notifier = StreamingNotifier(webhook_url, description, settings.STREAM_FLUSH_SECONDS) if stream else None
+        global_top = empty_contracts()
+        total_contracts = 0
+
+        # Los resultados llegan en el orden de los tickers a medida que se completan
+        for ticker in selected_tickers:
+            if ticker in reused:
+                options = reused[ticker]
+            else:
+                options = next(analyzed)
+                # Un análisis fallido no se guarda como "sin contratos": se repetirá en la próxima ejecución
+                if state is not None and "error" not in details[ticker]:
+                    _update_state(state, group_name, ticker, config, snapshots.get(ticker), quotes,
+                                  details[ticker], options)
+                if ticker in release_tickers:
+                    snapshots.release(ticker)
             processed_tickers += 1
-            if options:
+            total_contracts += len(options)
+            if len(options):
                 tickers_with_contracts += 1
                 logger.info(f"{ticker}: Encontrados {len(options)} contratos")
             else:
                 logger.info(f"{ticker}: No se encontraron contratos")
 
-        total_contracts = sum(len(contracts) for contracts in best_contracts_by_ticker.values())
-        logger.info(f"Resumen para {group_name}: {tickers_with_contracts}/{processed_tickers} tickers con contratos, {total_contracts} contratos en total")
-        send_discord_notification(best_contracts_by_ticker, webhook_url, description)
+            # Ranking global del grupo: los mejores contratos entre todos los tickers
+            with metrics.timed("global_ranking"):
+                global_top = rank_global({"global": global_top, ticker: options},
+                                         config["TOP_CONTRATOS_GLOBAL"], config["RANKING_GLOBAL"])
+            if notifier is not None:
+                notifier.add(ticker, options)
+            else:
+                best_contracts_by_ticker[ticker] = options
+
+        metrics.increment("tickers.with_contracts", tickers_with_contracts)
+        metrics.increment("contracts.selected", total_contracts)
+        summary = (f"Resumen para {group_name}: {tickers_with_contracts}/{processed_tickers} tickers con contratos, "
+                   f"{total_contracts} contratos en total")
+        logger.info(summary)
+
+        if notifier is not None:
+            notifier.close(global_top, f"{tickers_with_contracts}/{processed_tickers} tickers con contratos, "
+                                       f"{total_contracts} contratos en total")
+        else:
+            send_discord_notification(best_contracts_by_ticker, webhook_url, description,
+                                      background=settings.NOTIFY_IN_BACKGROUND, global_top=global_top)
         logger.info(f"Grupo {group_name} procesado exitosamente")
     except Exception as e:
         logger.error(f"Error procesando grupo {group_name}: {e}")
         logger.error(traceback.format_exc())
 
+def run_scan():
+    """
+    Ejecuta una pasada completa sobre todos los grupos de GROUPS_CONFIG y devuelve los grupos procesados.
+
+    Es la unidad de trabajo tanto de la ejecución puntual (main) como del modo daemon.
+    """
+    groups = settings.GROUPS_CONFIG
+    stream = settings.STREAM_NOTIFICATIONS
+    total_groups = len(groups)
+    processed_groups = 0
+
+    state = (ScanState(settings.STATE_PATH, settings.INCREMENTAL_MAX_SPOT_CHANGE, settings.INCREMENTAL_MAX_AGE_HOURS)
+             if settings.INCREMENTAL_ENABLED else None)
+
+    # Las descargas se comparten entre grupos: cada cadena se pide una sola vez.
+    # En modo streaming no se precargan y cada snapshot se libera tras el último grupo que lo usa.
+    snapshots, quotes, reused = prefetch_groups(groups, state, prefetch_chains=not stream)
+    last_group = {ticker: name for name, group in groups.items() for ticker in group["tickers"]}
+
+    for group_name, group_config in groups.items():
+        logger.info(f"Procesando grupo {group_name} ({processed_groups + 1}/{total_groups})...")
+        release_tickers = ({ticker for ticker, name in last_group.items() if name == group_name}
+                           if stream else None)
+        process_group(group_name, group_config, snapshots, quotes, reused[group_name], state,
+                      stream=stream, release_tickers=release_tickers)
+        processed_groups += 1
+
+    if state is not None:
+        state.save()
+    wait_for_notifications()
+    if market_cache is not None:
+        logger.info(market_cache.summary())
+        market_cache.evict()
+    if settings.ARCHIVE_ENABLED and settings.DATA_PROVIDER == "yfinance":
+        prune_archive(settings.ARCHIVE_DIR, settings.ARCHIVE_MAX_DAYS, data_fetcher.market_provider.now())
+    metrics.write_report(settings.RUN_REPORT_PATH,
+                         extra={"cache": market_cache.stats if market_cache is not None else None})
+    logger.info(f"Script finalizado. Procesados {processed_groups}/{total_groups} grupos.")
+    return processed_groups
+
 def main():
     try:
         # Mensaje inicial para confirmar que el script comienza
         print("Script iniciado - Configurando logging...")
         logger.info("Iniciando script para short PUT...")
-        
-        total_groups = len(GROUPS_CONFIG)
-        processed_groups = 0
-
-        for group_name, group_config in GROUPS_CONFIG.items():
-            logger.info(f"Procesando grupo {group_name} ({processed_groups + 1}/{total_groups})...")
-            process_group(group_name, group_config)
-            processed_groups += 1
-
-        logger.info(f"Script finalizado. Procesados {processed_groups}/{total_groups} grupos.")
+        run_scan()
     except Exception as e:
         logger.error(f"Error fatal en el script: {e}")
         logger.error(traceback.format_exc())
@@ -0,0 +1,32 @@
+# market_calendar.py
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+def is_market_open(moment=None):
+    """
+    Indica si el mercado regular de EE. UU. está abierto (lunes a viernes, 9:30-16:00 hora de Nueva York).
+
+    No tiene en cuenta festivos.
+    """
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    local = moment.astimezone(MARKET_TZ)
+    return local.weekday() < 5 and MARKET_OPEN <= local.time() < MARKET_CLOSE
+
+def next_market_open(moment=None):
+    """
+    Próxima apertura del mercado regular posterior a `moment` (en UTC). No tiene en cuenta festivos.
+    """
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    local = moment.astimezone(MARKET_TZ)
+    day = local.date() if local.time() < MARKET_OPEN else local.date() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return datetime.combine(day, MARKET_OPEN, tzinfo=MARKET_TZ).astimezone(timezone.utc)
@@ -1,46 +1,145 @@
 # option_analyzer.py
 import logging
-from data_fetcher import get_ticker_iv, get_option_data
+import numpy as np
+import pandas as pd
+import data_fetcher
+from data_fetcher import TickerSnapshot, empty_contracts, get_ticker_iv, get_option_data
+from instrumentation import metrics
 
-# Configurar logging para mostrar en consola
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def analyze_ticker(ticker, config):
+def prescreen_tickers(tickers, config, quotes=None):
     """
-    Analiza un ticker y devuelve las mejores opciones PUT.
+    Descarta con una única consulta masiva los tickers cuyo subyacente no pasa los filtros de precio y volumen.
+
+    Se ejecuta antes de pedir vencimientos o cadenas de opciones. Los tickers
+    sin cotización se conservan para que los evalúe el análisis individual.
+    """
+    if quotes is None:
+        try:
+            with metrics.timed("quotes_fetch"):
+                quotes = data_fetcher.market_provider.get_quotes(tickers)
+        except Exception as e:
+            logger.error(f"Error en el pre-filtro masivo de cotizaciones: {e}")
+            return list(tickers)
+
+    selected = []
+    for ticker in tickers:
+        quote = quotes.get(ticker)
+        if quote is None:
+            selected.append(ticker)
+            continue
+        price, volume = quote["price"], quote["average_volume"]
+        if price <= 0 or price > config["MAX_STOCK_PRICE"]:
+            logger.debug("%s: Descartado en pre-filtro - Precio $%.2f (máximo $%s)", ticker, price, config['MAX_STOCK_PRICE'])
+        elif volume < config["MIN_VOLUME_STOCK"]:
+            logger.debug("%s: Descartado en pre-filtro - Volumen promedio %.0f < %s", ticker, volume, config['MIN_VOLUME_STOCK'])
+        else:
+            selected.append(ticker)
+    logger.info(f"Pre-filtro de subyacentes: {len(selected)}/{len(tickers)} tickers superan precio y volumen")
+    return selected
+
+# Métricas disponibles para ordenar los contratos
+RANKING_METRICS = ("rentabilidad_anual", "rentabilidad_por_riesgo")
+
+def ranking_values(contracts, metric="rentabilidad_anual"):
+    """
+    Valores por los que se ordenan los contratos (mayor es mejor).
+
+    `rentabilidad_por_riesgo` es la prima anualizada sobre el riesgo neto
+    (capital comprometido), en porcentaje.
+    """
+    if metric == "rentabilidad_anual":
+        return contracts["rentabilidad_anual"].to_numpy(dtype=float)
+    if metric == "rentabilidad_por_riesgo":
+        premium = contracts["last_price"].to_numpy(dtype=float) * 100
+        days = contracts["days_to_expiration"].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return premium / contracts["net_risk"].to_numpy(dtype=float) * (365 / days) * 100
+    raise ValueError(f"Métrica de ranking desconocida: {metric} (disponibles: {', '.join(RANKING_METRICS)})")
+
+def select_top(contracts, k, metric="rentabilidad_anual"):
+    """
+    Devuelve los `k` mejores contratos ordenados de mayor a menor según `metric`.
+
+    Usa np.argpartition para no ordenar todo el conjunto: solo se ordenan los
+    `k` seleccionados. Los valores NaN quedan al final y los empates se
+    resuelven por orden original, como con una ordenación estable completa.
+    """
+    n = len(contracts)
+    if n == 0 or k <= 0:
+        return contracts.iloc[:0]
+    values = np.nan_to_num(ranking_values(contracts, metric), nan=-np.inf)
+    if k < n:
+        # argpartition elige arbitrariamente entre los empatados con el k-ésimo
+        # valor: se toman todos los mejores y se completa con los empatados de menor índice
+        threshold = values[np.argpartition(-values, k - 1)[k - 1]]
+        above = np.flatnonzero(values > threshold)
+        ties = np.flatnonzero(values == threshold)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(n)
+    # Dentro de cada valor los candidatos están en orden original y la ordenación es estable
+    order = candidates[np.argsort(-values[candidates], kind="stable")]
+    return contracts.take(order)
+
+def rank_global(contracts_by_ticker, top_n, metric="rentabilidad_anual"):
+    """
+    Mejores `top_n` contratos de todo el grupo, entre todos los tickers.
+    """
+    frames = [contracts for contracts in contracts_by_ticker.values() if len(contracts)]
+    if not frames:
+        return empty_contracts()
+    return select_top(pd.concat(frames, ignore_index=True), top_n, metric)
+
+def analyze_ticker(ticker, config, snapshot=None, details=None):
+    """
+    Analiza un ticker y devuelve las mejores opciones PUT como DataFrame.
+
+    `snapshot` permite reutilizar datos ya descargados (por ejemplo, por otro
+    grupo). Si se pasa un dict en `details`, se rellena con los datos del
+    subyacente calculados en el filtro de IV (precio, volumen, IV promedio) y,
+    si el análisis falla, con el error en details["error"]: el resultado vacío
+    no significa entonces que el ticker no tenga contratos.
     """
     try:
+        # Una sola descarga de datos compartida por el filtro de IV y el de PUTs
+        if snapshot is None:
+            snapshot = TickerSnapshot(ticker)
+
         # Obtener IV del ticker
-        ticker_data = get_ticker_iv(ticker, config)
+        with metrics.timed("iv_screen", ticker):
+            ticker_data = get_ticker_iv(ticker, config, snapshot, details)
         if not ticker_data:
             logger.info(f"No se analizarán opciones para {ticker} debido a filtros de IV o datos inválidos")
-            return []
+            return empty_contracts()
+        if details is not None:
+            details.update(ticker_data)
 
         # Log detallado de los datos del ticker
-        logger.debug(f"Datos del ticker {ticker}: {ticker_data}")
+        logger.debug("Datos del ticker %s: %s", ticker, ticker_data)
 
         # Obtener datos de opciones
-        options = get_option_data(ticker, config)
-        if not options:
+        with metrics.timed("put_scan", ticker):
+            options = get_option_data(ticker, config, snapshot, details)
+        if options.empty:
             logger.info(f"No se encontraron opciones válidas para {ticker}")
-            return []
+            return options
 
-        # Ordenar opciones por rentabilidad anual descendente
-        options.sort(key=lambda x: x["rentabilidad_anual"], reverse=True)
-
-        # Seleccionar las mejores opciones según el límite
-        top_options = options[:config["TOP_CONTRATOS_PER_TICKER"]]
+        # Seleccionar las mejores opciones por rentabilidad anual sin ordenar toda la cadena
+        with metrics.timed("sort", ticker):
+            top_options = select_top(options, config["TOP_CONTRATOS_PER_TICKER"])
         logger.info(f"Se seleccionaron {len(top_options)} de {len(options)} opciones para {ticker}")
         # Log detallado de las opciones seleccionadas
-        if top_options:
-            logger.debug(f"Opciones seleccionadas para {ticker}:")
-            for opt in top_options:
-                logger.debug(f"  - Strike ${opt['strike']:.2f}, Vencimiento {opt['expiration']}, Rentabilidad {opt['rentabilidad_anual']:.2f}%, Delta {opt['delta']:.2f}")
-        else:
-            logger.debug(f"No se seleccionaron opciones para {ticker} después de ordenar")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Opciones seleccionadas para %s:", ticker)
+            for opt in top_options.itertuples(index=False):
+                logger.debug("  - Strike $%.2f, Vencimiento %s, Rentabilidad %.2f%%, Delta %.2f",
+                             opt.strike, opt.expiration, opt.rentabilidad_anual, opt.delta)
 
         return top_options
     except Exception as e:
         logger.error(f"Error analizando ticker {ticker}: {e}")
-        return []
+        if details is not None:
+            details["error"] = str(e)
+        return empty_contracts()
@@ -0,0 +1,360 @@
+# providers.py
+import glob
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+from instrumentation import metrics
+from storage import load_frames, load_json, save_frames, save_json
+
+logger = logging.getLogger(__name__)
+
+class MarketDataProvider:
+    """
+    Interfaz de acceso a datos de mercado usada por TickerSnapshot.
+
+    Las implementaciones devuelven la información del subyacente (dict con las
+    claves de `yfinance.Ticker.info`), la lista de vencimientos ('YYYY-MM-DD')
+    y las cadenas de opciones como tupla (puts, calls) de DataFrames.
+    """
+    def now(self):
+        """
+        Momento de referencia de los datos, usado para calcular los días a vencimiento.
+        """
+        return datetime.now()
+
+    def refresh(self):
+        """
+        Descarta el estado de la pasada anterior para que la siguiente vuelva a pedir datos frescos.
+
+        Lo usa el modo daemon entre pasadas; las conexiones HTTP se conservan.
+        """
+
+    def get_info(self, ticker):
+        raise NotImplementedError
+
+    def get_expirations(self, ticker):
+        raise NotImplementedError
+
+    def get_option_chain(self, ticker, expiration):
+        raise NotImplementedError
+
+    def get_quotes(self, tickers):
+        """
+        Cotización de varios tickers: dict ticker -> {"price", "previous_close", "average_volume"}.
+
+        La implementación por defecto consulta `get_info` ticker a ticker; los
+        proveedores en red la sustituyen por una descarga masiva. Los tickers
+        sin datos no aparecen en el resultado.
+        """
+        quotes = {}
+        for ticker in tickers:
+            try:
+                info = self.get_info(ticker)
+            except Exception as e:
+                logger.debug("Sin cotización para %s: %s", ticker, e)
+                continue
+            quotes[ticker] = {
+                "price": info.get('regularMarketPrice', info.get('previousClose', 0)),
+                "previous_close": info.get('previousClose', 0),
+                "average_volume": info.get('averageVolume', 0),
+            }
+        return quotes
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Proveedor en vivo basado en yfinance, limitado por un token bucket.
+    """
+    def __init__(self, rate_limiter=None, quotes_chunk_size=20):
+        self.rate_limiter = rate_limiter
+        self.quotes_chunk_size = max(1, quotes_chunk_size)
+        self._tickers = {}
+        self._lock = threading.Lock()
+
+    def _ticker(self, ticker):
+        # Se reutiliza el mismo yf.Ticker: option_chain necesita la lista de
+        # vencimientos ya descargada para no repetir la petición.
+        import yfinance as yf
+        with self._lock:
+            if ticker not in self._tickers:
+                self._tickers[ticker] = yf.Ticker(ticker)
+            return self._tickers[ticker]
+
+    def refresh(self):
+        # Cada yf.Ticker guarda su info y sus vencimientos; la sesión HTTP de yfinance es compartida y sigue activa
+        with self._lock:
+            self._tickers.clear()
+
+    def _acquire(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    @staticmethod
+    def _count(kind, size, requests=1):
+        metrics.increment(f"requests.{kind}", requests)
+        metrics.increment(f"bytes.{kind}", int(size))
+
+    def get_info(self, ticker):
+        self._acquire()
+        info = self._ticker(ticker).info
+        self._count("info", len(json.dumps(info, default=str)))
+        return info
+
+    def get_expirations(self, ticker):
+        self._acquire()
+        expirations = list(self._ticker(ticker).options)
+        self._count("expirations", len(json.dumps(expirations)))
+        return expirations
+
+    def get_option_chain(self, ticker, expiration):
+        self._acquire()
+        opt = self._ticker(ticker).option_chain(expiration)
+        # Tamaño aproximado: memoria ocupada por las cadenas recibidas
+        self._count("chain", opt.puts.memory_usage(deep=True).sum() + opt.calls.memory_usage(deep=True).sum())
+        return opt.puts, opt.calls
+
+    def get_quotes(self, tickers):
+        # Precios diarios de 3 meses, equivalentes a regularMarketPrice /
+        # previousClose / averageVolume de `info`. yf.download hace una petición
+        # por ticker, así que se descarga por bloques sin hilos y cada ticker
+        # consume un token del limitador.
+        import yfinance as yf
+        tickers = list(tickers)
+        quotes = {}
+        for start in range(0, len(tickers), self.quotes_chunk_size):
+            chunk = tickers[start:start + self.quotes_chunk_size]
+            for _ in chunk:
+                self._acquire()
+            history = yf.download(chunk, period="3mo", interval="1d", group_by="column",
+                                  auto_adjust=False, progress=False, threads=False)
+            if history is None or history.empty:
+                self._count("quotes", 0, len(chunk))
+                continue
+            self._count("quotes", history.memory_usage(deep=True).sum(), len(chunk))
+            closes, volumes = history["Close"], history["Volume"]
+            if closes.ndim == 1:
+                closes, volumes = closes.to_frame(chunk[0]), volumes.to_frame(chunk[0])
+            for ticker in closes.columns:
+                close = closes[ticker].dropna()
+                if close.empty:
+                    continue
+                quotes[ticker] = {
+                    "price": float(close.iloc[-1]),
+                    "previous_close": float(close.iloc[-2] if len(close) > 1 else close.iloc[-1]),
+                    "average_volume": float(volumes[ticker].dropna().mean()),
+                }
+        return quotes
+
+class CachingProvider(MarketDataProvider):
+    """
+    Envuelve otro proveedor con la caché en disco de `cache.OptionChainCache`.
+    """
+    def __init__(self, inner, cache):
+        self.inner = inner
+        self.cache = cache
+
+    def now(self):
+        return self.inner.now()
+
+    def refresh(self):
+        self.inner.refresh()
+
+    def _fetch(self, kind, ticker, fetch, expiration=None):
+        value = self.cache.get(kind, ticker, expiration)
+        if value is None:
+            value = fetch()
+            self.cache.put(kind, ticker, value, expiration)
+        return value
+
+    def get_info(self, ticker):
+        return self._fetch("info", ticker, lambda: self.inner.get_info(ticker))
+
+    def get_expirations(self, ticker):
+        return self._fetch("expirations", ticker, lambda: self.inner.get_expirations(ticker))
+
+    def get_option_chain(self, ticker, expiration):
+        return self._fetch("chain", ticker, lambda: self.inner.get_option_chain(ticker, expiration), expiration)
+
+    def get_quotes(self, tickers):
+        return self.inner.get_quotes(tickers)
+
+# Estructura de una grabación:
+#   <directorio>/manifest.json                  {"recorded_at": "..."}
+#   <directorio>/quotes_<pid>.json              cotizaciones del pre-filtro masivo, un fichero por proceso
+#   <directorio>/<TICKER>/info.json
+#   <directorio>/<TICKER>/expirations.json
+#   <directorio>/<TICKER>/chain_<vencimiento>.npz  (puts y calls, ver storage)
+
+def load_recorded_quotes(directory):
+    """
+    Cotizaciones grabadas en `directory`, combinando los ficheros de todos los procesos; None si no hay ninguno.
+
+    Incluye el quotes.json único de las grabaciones anteriores.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "quotes.json")) +
+                   glob.glob(os.path.join(directory, "quotes_*.json")))
+    if not paths:
+        return None
+    recorded = {}
+    for path in paths:
+        recorded.update(load_json(path))
+    return recorded
+
+class RecordingProvider(MarketDataProvider):
+    """
+    Envuelve otro proveedor y graba cada respuesta para reproducirla después con ReplayProvider.
+
+    Con `chain_columns` / `info_keys` solo se graban esas columnas de las
+    cadenas y esas claves de la información del subyacente; el llamador
+    recibe siempre los datos completos.
+    """
+    def __init__(self, inner, directory, chain_columns=None, info_keys=None):
+        self.inner = inner
+        self.chain_columns = chain_columns
+        self.info_keys = info_keys
+        self._quotes_lock = threading.Lock()
+        self._open(directory)
+
+    def _open(self, directory):
+        self.directory = directory
+        self.recorded_at = self.inner.now()
+        self._manifest_saved = False
+
+    def _path(self, ticker, name):
+        # El manifiesto se escribe con la primera respuesta: un proveedor sin uso no deja directorios vacíos
+        if not self._manifest_saved:
+            save_json(os.path.join(self.directory, "manifest.json"), {"recorded_at": self.recorded_at.isoformat()})
+            self._manifest_saved = True
+        if ticker is None:
+            return os.path.join(self.directory, name)
+        return os.path.join(self.directory, ticker.upper(), name)
+
+    def _stored_chain(self, chain):
+        if self.chain_columns is None:
+            return chain
+        return chain[[column for column in self.chain_columns if column in chain.columns]]
+
+    def now(self):
+        return self.recorded_at
+
+    def refresh(self):
+        # Nueva pasada del daemon: el momento de la grabación se actualiza con los datos
+        self.inner.refresh()
+        self._open(self.directory)
+
+    def get_info(self, ticker):
+        info = self.inner.get_info(ticker)
+        stored = info if self.info_keys is None else {key: info[key] for key in self.info_keys if key in info}
+        save_json(self._path(ticker, "info.json"), stored)
+        return info
+
+    def get_expirations(self, ticker):
+        expirations = list(self.inner.get_expirations(ticker))
+        save_json(self._path(ticker, "expirations.json"), expirations)
+        return expirations
+
+    def get_option_chain(self, ticker, expiration):
+        puts, calls = self.inner.get_option_chain(ticker, expiration)
+        save_frames(self._path(ticker, f"chain_{expiration}.npz"),
+                    {"puts": self._stored_chain(puts), "calls": self._stored_chain(calls)},
+                    meta={"ticker": ticker, "expiration": expiration})
+        return puts, calls
+
+    def get_quotes(self, tickers):
+        quotes = self.inner.get_quotes(tickers)
+        # Varios procesos (shards) pueden grabar en el mismo directorio: cada uno
+        # escribe su propio fichero y ReplayProvider los combina al leer
+        with self._quotes_lock:
+            path = self._path(None, f"quotes_{os.getpid()}.json")
+            recorded = load_json(path) if os.path.exists(path) else {}
+            recorded.update(quotes)
+            save_json(path, recorded)
+        return quotes
+
+# Archivo histórico: una grabación compacta por ejecución, particionada por fecha
+#   <raíz>/date=YYYY-MM-DD/run=HHMMSS_ffffff/   (misma estructura que una grabación)
+# Cada ejecución escribe en un directorio nuevo y nunca modifica los anteriores.
+ARCHIVE_CHAIN_COLUMNS = ("strike", "lastPrice", "bid", "ask", "volume", "openInterest", "impliedVolatility",
+                         "inTheMoney")
+ARCHIVE_INFO_KEYS = ("regularMarketPrice", "previousClose", "averageVolume")
+
+def archive_run_directory(root, moment):
+    return os.path.join(root, f"date={moment:%Y-%m-%d}", f"run={moment:%H%M%S_%f}")
+
+def prune_archive(root, max_days, today):
+    """
+    Borra del archivo las fechas anteriores a `today` menos `max_days` días y devuelve cuántas se han borrado.
+    """
+    if max_days <= 0 or not os.path.isdir(root):
+        return 0
+    oldest = f"date={today - timedelta(days=max_days):%Y-%m-%d}"
+    removed = 0
+    for name in sorted(os.listdir(root)):
+        if name.startswith("date=") and name < oldest:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info(f"Archivo histórico: eliminadas {removed} fechas de más de {max_days} días")
+    return removed
+
+class ArchivingProvider(RecordingProvider):
+    """
+    Graba cada ejecución en el archivo histórico (solo las columnas que usa el screen).
+
+    Envuelve al proveedor en vivo, por debajo de la caché, así que cada
+    respuesta se archiva una sola vez, en la ejecución que la descargó. Cada
+    directorio de ejecución se puede reproducir con ReplayProvider (con las
+    ejecuciones anteriores como respaldo); el backtest (backtest.py) recorre
+    el archivo fecha a fecha. `refresh` (modo daemon) empieza una ejecución nueva.
+    """
+    def __init__(self, inner, root):
+        self.root = root
+        super().__init__(inner, archive_run_directory(root, inner.now()), ARCHIVE_CHAIN_COLUMNS, ARCHIVE_INFO_KEYS)
+
+    def refresh(self):
+        self.inner.refresh()
+        self._open(archive_run_directory(self.root, self.inner.now()))
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Reproduce una grabación de RecordingProvider desde disco, sin acceso a red.
+
+    `now()` devuelve el momento de la grabación, de modo que los días a
+    vencimiento (y por tanto los resultados) son deterministas. Los datos que
+    no estén en `directory` se buscan en `fallback_dirs` (por ejemplo, las
+    ejecuciones archivadas anteriores que descargaron lo que esta sirvió
+    desde la caché), en ese orden.
+    """
+    def __init__(self, directory, fallback_dirs=()):
+        self.directory = directory
+        self.fallback_dirs = list(fallback_dirs)
+        manifest = load_json(os.path.join(directory, "manifest.json"))
+        self.recorded_at = datetime.fromisoformat(manifest["recorded_at"])
+
+    def now(self):
+        return self.recorded_at
+
+    def _path(self, ticker, name):
+        for directory in [self.directory] + self.fallback_dirs:
+            path = os.path.join(directory, ticker.upper(), name)
+            if os.path.exists(path):
+                return path
+        raise LookupError(f"No hay datos grabados para {ticker}: {name}")
+
+    def get_info(self, ticker):
+        return load_json(self._path(ticker, "info.json"))
+
+    def get_expirations(self, ticker):
+        return load_json(self._path(ticker, "expirations.json"))
+
+    def get_option_chain(self, ticker, expiration):
+        frames, _ = load_frames(self._path(ticker, f"chain_{expiration}.npz"))
+        return frames["puts"], frames["calls"]
+
+    def get_quotes(self, tickers):
+        recorded = load_recorded_quotes(self.directory)
+        if recorded is None:
+            return super().get_quotes(tickers)
+        return {ticker: recorded[ticker] for ticker in tickers if ticker in recorded}
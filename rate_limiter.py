@@ -0,0 +1,44 @@
+# rate_limiter.py
+import threading
+import time
+
+class TokenBucket:
+    """
+    Limitador de peticiones tipo token bucket, seguro entre hilos.
+
+    Se reponen `rate` tokens por segundo hasta un máximo de `burst`. Cada
+    petición al proveedor de datos consume un token; si no hay tokens
+    disponibles, `acquire` espera lo necesario.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate, burst=None):
+        """
+        Cambia el ritmo de reposición (por ejemplo, para repartir el límite entre varios procesos).
+        """
+        with self._lock:
+            self.rate = float(rate)
+            self.burst = float(burst if burst is not None else max(1.0, rate))
+            self._tokens = min(self._tokens, self.burst)
+
+    def acquire(self, tokens=1):
+        """
+        Consume `tokens` tokens, bloqueando hasta que estén disponibles.
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
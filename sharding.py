@@ -0,0 +1,245 @@
+# sharding.py
+"""
+Escaneo por shards de un universo grande de tickers (miles de subyacentes con opciones).
+
+El universo se lee de un fichero, se parte en shards y cada shard se procesa
+en un pool de procesos con el mismo screen de short PUT que main.py. Cada
+proceso escribe en disco solo los contratos seleccionados de su shard (un
+.npz pequeño); el proceso principal los combina shard a shard, de modo que la
+memoria no crece con el tamaño del universo. Con --resume se reutilizan los
+shards ya completados de una ejecución interrumpida.
+
+    python sharding.py --universe universe.txt --processes 4
+    python sharding.py --universe universe.txt --resume
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from config import (ARCHIVE_DIR, ARCHIVE_ENABLED, ARCHIVE_MAX_DAYS, DATA_PROVIDER, GROUPS_CONFIG, LOG_LEVEL, MAX_REQUESTS_PER_SECOND, RATE_LIMIT_BURST, RUN_REPORT_PATH,
+                    SHARD_DIR, SHARD_PROCESSES, SHARD_REQUESTS_PER_SECOND, SHARD_SIZE, STREAM_FLUSH_SECONDS,
+                    STREAM_NOTIFICATIONS, UNIVERSE_PATH)
+import data_fetcher
+from data_fetcher import SnapshotStore, empty_contracts, market_cache
+from discord_notifier import StreamingNotifier, send_discord_notification, wait_for_notifications
+from instrumentation import metrics
+from main import fetch_quotes, iter_analyze_tickers
+from option_analyzer import prescreen_tickers, rank_global
+from providers import prune_archive
+from storage import load_frames, load_json, save_frames, save_json
+
+logger = logging.getLogger(__name__)
+
+def load_universe(path):
+    """
+    Lee el universo de tickers: uno por línea (o la primera columna de un CSV), sin duplicados.
+
+    Se ignoran las líneas vacías, los comentarios (#) y una cabecera "ticker"/"symbol".
+    """
+    tickers = []
+    with open(path) as f:
+        for line in f:
+            ticker = line.split("#", 1)[0].split(",", 1)[0].strip().upper()
+            if ticker and ticker not in ("TICKER", "SYMBOL"):
+                tickers.append(ticker)
+    return list(dict.fromkeys(tickers))
+
+def make_shards(tickers, shard_size):
+    return [tickers[i:i + shard_size] for i in range(0, len(tickers), shard_size)]
+
+def _shard_path(directory, index):
+    return os.path.join(directory, f"shard_{index:05d}.npz")
+
+def _run_fingerprint(group_name, group_config, shards):
+    # Identifica la ejecución: un shard solo se reutiliza si el universo, el reparto y los filtros coinciden
+    payload = json.dumps({"group": group_name, "config": group_config["config"], "shards": shards},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def prepare_shard_dir(directory, fingerprint, shard_count, resume=False):
+    """
+    Prepara el directorio de resultados y devuelve los índices de los shards que faltan por procesar.
+
+    Con `resume=True` y la misma huella de ejecución se conservan los shards
+    ya completados; en otro caso se borran los resultados anteriores.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, "manifest.json")
+    same_run = False
+    if resume and os.path.exists(manifest_path):
+        try:
+            same_run = load_json(manifest_path).get("fingerprint") == fingerprint
+        except Exception as e:
+            logger.warning(f"No se pudo leer {manifest_path}: {e}")
+        if not same_run:
+            logger.warning("El universo o la configuración han cambiado; no se reanudan los shards anteriores")
+    if not same_run:
+        for name in os.listdir(directory):
+            if name.startswith("shard_") and name.endswith(".npz"):
+                os.remove(os.path.join(directory, name))
+        save_json(manifest_path, {"fingerprint": fingerprint, "shards": shard_count})
+    return [index for index in range(shard_count) if not os.path.exists(_shard_path(directory, index))]
+
+def _init_worker(requests_per_second):
+    # Cada proceso tiene su propio limitador; se ajusta para respetar el límite acordado para el shard
+    if requests_per_second is not None:
+        data_fetcher.rate_limiter.set_rate(requests_per_second, min(RATE_LIMIT_BURST, max(1.0, requests_per_second)))
+
+def scan_shard(index, tickers, group_name, group_config, path):
+    """
+    Ejecuta el screen sobre un shard y guarda en `path` sus contratos seleccionados.
+
+    Se ejecuta en un proceso del pool. Los snapshots se liberan en cuanto se
+    analiza cada ticker, así que la memoria del proceso depende solo del
+    número de hilos, no del tamaño del shard. Devuelve (índice, contratos).
+    """
+    metrics.reset()
+    metrics.start_group(group_name)
+    config = group_config["config"]
+    quotes = fetch_quotes(tickers)
+    with metrics.timed("prescreen"):
+        selected = prescreen_tickers(tickers, config, quotes)
+    metrics.increment("tickers.total", len(tickers))
+    metrics.increment("tickers.prescreened", len(selected))
+
+    snapshots = SnapshotStore(quotes=quotes)
+    frames = []
+    for ticker, contracts in zip(selected, iter_analyze_tickers(selected, config, snapshots)):
+        snapshots.release(ticker)
+        if len(contracts):
+            frames.append(contracts)
+    contracts = pd.concat(frames, ignore_index=True) if frames else empty_contracts()
+    metrics.increment("tickers.with_contracts", len(frames))
+    metrics.increment("contracts.selected", len(contracts))
+
+    report = metrics.report()
+    save_frames(path, {"contracts": contracts},
+                meta={"shard": index, "tickers": len(tickers), "prescreened": len(selected),
+                      "report": {key: report[key] for key in ("stages", "counters", "groups")}})
+    return index, len(contracts)
+
+def iter_shard_results(directory, shard_count):
+    """
+    Devuelve, shard a shard y en orden, (contratos, metadatos) de los shards completados.
+    """
+    for index in range(shard_count):
+        path = _shard_path(directory, index)
+        if not os.path.exists(path):
+            continue
+        frames, meta = load_frames(path)
+        yield frames["contracts"], meta
+
+def merge_and_notify(group_name, group_config, directory, shard_count, stream=STREAM_NOTIFICATIONS):
+    """
+    Combina los resultados de los shards y envía la notificación del grupo.
+
+    Solo se mantiene en memoria el shard que se está combinando y el ranking
+    global; con `stream=True` los bloques por ticker se envían según se leen.
+    """
+    config = group_config["config"]
+    description = group_config["description"]
+    webhook_url = group_config["webhook"]
+    notifier = StreamingNotifier(webhook_url, description, STREAM_FLUSH_SECONDS) if stream else None
+    best_contracts_by_ticker = {}
+    global_top = empty_contracts()
+    tickers_total = tickers_with_contracts = total_contracts = 0
+
+    for contracts, meta in iter_shard_results(directory, shard_count):
+        metrics.merge(meta["report"])
+        tickers_total += meta["tickers"]
+        for ticker, ticker_contracts in contracts.groupby("ticker", sort=False):
+            ticker_contracts = ticker_contracts.reset_index(drop=True)
+            tickers_with_contracts += 1
+            total_contracts += len(ticker_contracts)
+            if notifier is not None:
+                notifier.add(ticker, ticker_contracts)
+            else:
+                best_contracts_by_ticker[ticker] = ticker_contracts
+        with metrics.timed("global_ranking"):
+            global_top = rank_global({"global": global_top, "shard": contracts},
+                                     config["TOP_CONTRATOS_GLOBAL"], config["RANKING_GLOBAL"])
+
+    summary = f"{tickers_with_contracts}/{tickers_total} tickers con contratos, {total_contracts} contratos en total"
+    logger.info(f"Resumen para {group_name}: {summary}")
+    if notifier is not None:
+        notifier.close(global_top, summary)
+    else:
+        send_discord_notification(best_contracts_by_ticker, webhook_url, description, global_top=global_top)
+    return global_top
+
+def run_sharded(group_name, group_config, tickers, shard_size=SHARD_SIZE, processes=SHARD_PROCESSES,
+                shard_dir=SHARD_DIR, resume=False, requests_per_second=SHARD_REQUESTS_PER_SECOND):
+    """
+    Procesa `tickers` por shards en un pool de procesos y notifica el resultado combinado.
+
+    Si `requests_per_second` es None, MAX_REQUESTS_PER_SECOND se reparte entre
+    los procesos. Un shard que falla no detiene al resto; se vuelve a
+    intentar al relanzar con `resume=True`. Devuelve el número de shards fallidos.
+    """
+    metrics.start_group(group_name)
+    shards = make_shards(tickers, shard_size)
+    directory = os.path.join(shard_dir, group_name)
+    pending = prepare_shard_dir(directory, _run_fingerprint(group_name, group_config, shards), len(shards), resume)
+    if requests_per_second is None and MAX_REQUESTS_PER_SECOND > 0:
+        requests_per_second = MAX_REQUESTS_PER_SECOND / max(1, min(processes, len(pending)))
+    logger.info(f"{group_name}: {len(tickers)} tickers en {len(shards)} shards, {len(shards) - len(pending)} ya completados, "
+                f"{processes} procesos")
+
+    failed = 0
+    if pending:
+        with metrics.timed("shards"), ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                                          initargs=(requests_per_second,)) as executor:
+            futures = {executor.submit(scan_shard, index, shards[index], group_name, group_config,
+                                       _shard_path(directory, index)): index for index in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    index, selected = future.result()
+                    logger.info(f"Shard {index + 1}/{len(shards)} completado: {selected} contratos ({done}/{len(pending)})")
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Error en el shard {futures[future] + 1}/{len(shards)}: {e}")
+    metrics.increment("shards.total", len(shards))
+    metrics.increment("shards.resumed", len(shards) - len(pending))
+    metrics.increment("shards.failed", failed)
+    if failed:
+        logger.warning(f"{failed} shards fallidos; relanza con --resume para completarlos")
+
+    merge_and_notify(group_name, group_config, directory, len(shards))
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen de short PUT por shards sobre un universo grande")
+    parser.add_argument("--universe", default=UNIVERSE_PATH, help="Fichero con un ticker por línea")
+    parser.add_argument("--group", default=next(iter(GROUPS_CONFIG)), help="Grupo de GROUPS_CONFIG cuyos filtros y webhook se usan")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Tickers por shard")
+    parser.add_argument("--processes", type=int, default=SHARD_PROCESSES, help="Procesos en paralelo")
+    parser.add_argument("--shard-dir", default=SHARD_DIR, help="Directorio de resultados por shard")
+    parser.add_argument("--requests-per-second", type=float, default=SHARD_REQUESTS_PER_SECOND,
+                        help="Límite de peticiones de cada proceso (por defecto se reparte el global)")
+    parser.add_argument("--resume", action="store_true", help="Reutilizar los shards ya completados")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        tickers = load_universe(args.universe)
+        failed = run_sharded(args.group, GROUPS_CONFIG[args.group], tickers, args.shard_size, args.processes,
+                             args.shard_dir, args.resume, args.requests_per_second)
+        wait_for_notifications()
+        if market_cache is not None:
+            market_cache.evict()
+        if ARCHIVE_ENABLED and DATA_PROVIDER == "yfinance":
+            prune_archive(ARCHIVE_DIR, ARCHIVE_MAX_DAYS, data_fetcher.market_provider.now())
+        metrics.write_report(RUN_REPORT_PATH)
+        return 1 if failed else 0
+    except Exception as e:
+        logger.error(f"Error fatal en el escaneo por shards: {e}")
+        logger.error(traceback.format_exc())
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# state.py
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from data_fetcher import CONTRACT_COLUMNS, empty_contracts
+from storage import load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+def inputs_fingerprint(snapshot, max_days):
+    """
+    Huella de los datos baratos del ticker: vencimientos dentro del horizonte y último cierre.
+
+    Cambia cuando un vencimiento expira o aparece uno nuevo y al empezar una
+    sesión nueva (cambia el último cierre, y con él el open interest y el
+    volumen de las cadenas). Ambos datos salen de la cotización masiva y de
+    la lista de vencimientos, sin descargar cadenas.
+    """
+    expirations = [e for e in snapshot.expirations if 0 <= snapshot.days_to_expiration(e) <= max_days]
+    payload = f"{snapshot.previous_close:.4f}|{','.join(expirations)}"
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+def config_fingerprint(config):
+    """
+    Huella de los filtros del grupo; un resultado guardado con otros filtros no se reutiliza.
+    """
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+class ScanState:
+    """
+    Estado de la última evaluación de cada ticker por grupo, para re-escaneos incrementales.
+
+    Por cada grupo y ticker se guarda el precio del subyacente, la IV ATM
+    promedio, la huella de datos (inputs_fingerprint), la huella de los
+    filtros del grupo, el momento de la evaluación y los contratos
+    seleccionados. Un ticker se reutiliza sin descargar cadenas si el precio
+    no se ha movido más de `max_spot_change`, ambas huellas coinciden y la
+    evaluación no es más antigua que `max_age_hours`.
+
+    Las cadenas no se consultan: los cambios de IV, primas o bid dentro de la
+    misma sesión no se detectan hasta que vence `max_age_hours` (la IV ATM se
+    guarda solo como referencia, no se compara).
+    """
+    def __init__(self, path, max_spot_change, max_age_hours):
+        self.path = path
+        self.max_spot_change = max_spot_change
+        self.max_age_hours = max_age_hours
+        self.groups = {}
+        if os.path.exists(path):
+            try:
+                self.groups = load_json(path).get("groups", {})
+            except Exception as e:
+                logger.warning(f"No se pudo leer el estado {path}, se hará un escaneo completo: {e}")
+
+    def entry(self, group_name, ticker):
+        return self.groups.get(group_name, {}).get(ticker)
+
+    def is_unchanged(self, group_name, ticker, spot, fingerprint, config_hash, now):
+        entry = self.entry(group_name, ticker)
+        if entry is None or not spot or spot <= 0:
+            return False
+        age_hours = (now - datetime.fromisoformat(entry["evaluated_at"])).total_seconds() / 3600
+        spot_change = abs(spot - entry["spot"]) / entry["spot"] if entry["spot"] else float("inf")
+        return (entry["fingerprint"] == fingerprint
+                and entry.get("config") == config_hash
+                and spot_change <= self.max_spot_change
+                and 0 <= age_hours <= self.max_age_hours)
+
+    def reusable_contracts(self, group_name, ticker, now, config):
+        """
+        Contratos guardados de un ticker, con días a vencimiento y rentabilidad anual recalculados a `now`.
+
+        Se eliminan los que ya han vencido o ya no alcanzan MIN_RENTABILIDAD_ANUAL.
+        """
+        records = self.entry(group_name, ticker)["contracts"]
+        if not records:
+            return empty_contracts()
+        contracts = pd.DataFrame(records, columns=CONTRACT_COLUMNS)
+        expiration_dates = pd.to_datetime(contracts["expiration"], format='%Y-%m-%d')
+        days = ((expiration_dates - pd.Timestamp(now)).dt.days).to_numpy()
+        spot = self.entry(group_name, ticker)["spot"]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rentabilidad_anual = contracts["last_price"].to_numpy(dtype=float) * 100 / spot * (365 / days)
+        contracts["days_to_expiration"] = days
+        contracts["rentabilidad_anual"] = rentabilidad_anual
+        keep = (days > 0) & (rentabilidad_anual >= config["MIN_RENTABILIDAD_ANUAL"])
+        return contracts[keep].reset_index(drop=True)
+
+    def update(self, group_name, ticker, spot, avg_iv, fingerprint, config_hash, contracts, now):
+        columns = list(contracts.columns)
+        records = [dict(zip(columns, row)) for row in zip(*(contracts[column].tolist() for column in columns))]
+        self.groups.setdefault(group_name, {})[ticker] = {
+            "spot": spot,
+            "avg_iv": avg_iv,
+            "fingerprint": fingerprint,
+            "config": config_hash,
+            "evaluated_at": now.isoformat(),
+            "contracts": records,
+        }
+
+    def save(self):
+        try:
+            save_json(self.path, {"groups": self.groups})
+        except Exception as e:
+            logger.error(f"No se pudo guardar el estado en {self.path}: {e}")
@@ -0,0 +1,68 @@
+# storage.py
+import io
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Formato columnar compacto para cadenas de opciones: cada columna de cada
+# DataFrame se guarda como un array de NumPy dentro de un único .npz comprimido.
+
+def _tmp_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def _column_to_array(series):
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy()
+    # Fechas, textos y columnas mixtas se guardan como texto
+    return series.astype(str).to_numpy(dtype=str)
+
+def save_frames(path, frames, meta=None):
+    """
+    Guarda varios DataFrames (dict nombre -> DataFrame) y metadatos JSON en un .npz.
+
+    La escritura es atómica: se escribe a un fichero temporal y se renombra.
+    """
+    arrays = {"__meta__": np.array(json.dumps(meta or {}, default=str))}
+    for name, frame in frames.items():
+        arrays[f"{name}__columns__"] = np.array([str(column) for column in frame.columns], dtype=str)
+        for i, column in enumerate(frame.columns):
+            arrays[f"{name}__{i}"] = _column_to_array(frame[column])
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+def load_frames(path):
+    """
+    Carga un .npz escrito por `save_frames` y devuelve (frames, meta).
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["__meta__"]))
+        frames = {}
+        for key in data.files:
+            if not key.endswith("__columns__"):
+                continue
+            name = key[:-len("__columns__")]
+            columns = list(data[key])
+            frames[name] = pd.DataFrame({column: data[f"{name}__{i}"] for i, column in enumerate(columns)},
+                                        columns=columns)
+    return frames, meta
+
+def save_json(path, value):
+    """
+    Guarda un valor JSON de forma atómica.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(value, f, default=str)
+    os.replace(tmp_path, path)
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
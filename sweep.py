@@ -0,0 +1,218 @@
+# sweep.py
+"""
+Barrido de umbrales del screen de short PUT sobre una única descarga de datos.
+
+Descarga (o reproduce, con DATA_PROVIDER=replay) una vez las cadenas del
+grupo y evalúa todas las combinaciones de umbrales de una rejilla en una sola
+pasada vectorizada: cada combinación es una fila de una matriz
+configuraciones x contratos. Por cada combinación se calcula lo mismo que
+seleccionaría main.py (los TOP_CONTRATOS_PER_TICKER mejores por ticker) y se
+informa del número de contratos, la rentabilidad anual media y el capital en
+riesgo.
+
+    python sweep.py
+    python sweep.py --param MIN_BID=0.1:0.5:0.05 --param TARGET_DELTA_MIN=-0.3,-0.2,-0.15
+"""
+import argparse
+import itertools
+import logging
+import sys
+import time
+import numpy as np
+import pandas as pd
+from config import GROUPS_CONFIG, LOG_LEVEL
+from data_fetcher import get_ticker_iv, put_chain_metrics
+from main import prefetch_groups
+
+logger = logging.getLogger(__name__)
+
+# Umbrales que se pueden barrer; el resto de filtros se aplica una sola vez con el valor del grupo
+SWEEP_PARAMETERS = ("MIN_RENTABILIDAD_ANUAL", "TARGET_DELTA_MIN", "TARGET_DELTA_MAX", "MIN_STRIKE_DISTANCE",
+                    "MIN_BID", "MAX_RISK_PER_TRADE")
+
+# Rejilla por defecto (6.480 combinaciones)
+DEFAULT_GRID = {
+    "MIN_RENTABILIDAD_ANUAL": "20:60:5",
+    "TARGET_DELTA_MIN": "-0.35:-0.10:0.05",
+    "MIN_STRIKE_DISTANCE": "0.02:0.12:0.02",
+    "MIN_BID": "0.1:0.5:0.1",
+    "MAX_RISK_PER_TRADE": "0.02:0.08:0.02",
+}
+
+# Tamaño máximo (configuraciones x contratos) de cada bloque de la matriz
+CHUNK_ELEMENTS = 4_000_000
+
+def parse_values(text):
+    """
+    Valores de un parámetro: lista separada por comas ("0.1,0.2") o rango inclusivo "inicio:fin:paso".
+    """
+    if ":" in text:
+        start, stop, step = (float(part) for part in text.split(":"))
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(count)]
+    return [float(part) for part in text.split(",")]
+
+def build_grid(values_by_parameter, config):
+    """
+    Producto cartesiano de los valores de cada parámetro como dict parámetro -> array (una posición por configuración).
+
+    Los parámetros que no se barren toman el valor de `config`.
+    """
+    values = [values_by_parameter.get(name, [config[name]]) for name in SWEEP_PARAMETERS]
+    combinations = np.array(list(itertools.product(*values)), dtype=float).reshape(-1, len(SWEEP_PARAMETERS))
+    return {name: combinations[:, i] for i, name in enumerate(SWEEP_PARAMETERS)}
+
+def collect_candidates(tickers, config, snapshots):
+    """
+    Contratos de todos los tickers que superan los filtros que no se barren, agrupados por ticker.
+
+    Devuelve un dict de arrays ordenados por ticker y, dentro de cada ticker,
+    por rentabilidad anual descendente (el orden de select_top), más
+    `starts` y `names`: posición inicial y nombre de cada ticker.
+    """
+    frames, names = [], []
+    for ticker in tickers:
+        snapshot = snapshots.get(ticker)
+        try:
+            if not get_ticker_iv(ticker, config, snapshot):
+                continue
+            current_price = snapshot.current_price
+            chains = []
+            for expiration in snapshot.expirations:
+                days_to_expiration = snapshot.days_to_expiration(expiration)
+                if days_to_expiration <= config["MAX_DIAS_VENCIMIENTO"]:
+                    chain, _ = snapshot.option_chain(expiration)
+                    if not chain.empty:
+                        chains.append(chain.assign(expiration=expiration, days_to_expiration=days_to_expiration))
+            if current_price <= 0 or not chains:
+                continue
+        except Exception as e:
+            logger.warning(f"{ticker}: se omite del barrido: {e}")
+            continue
+        columns = put_chain_metrics(pd.concat(chains, ignore_index=True), current_price, config)
+        # Mismas comparaciones que filter_put_chain: un dato ausente no descarta salvo en el delta
+        keep = (~(columns["strike"] >= current_price)
+                & ~(columns["last_price"] <= 0)
+                & ~(columns["last_price"] < 1.0)
+                & ~(columns["volume"] < config["MIN_VOLUMEN"])
+                & ~(columns["open_interest"] < config["MIN_OPEN_INTEREST"])
+                & ~np.isnan(columns["delta"])
+                & (columns["days_to_expiration"] > 0))
+        if keep.any():
+            frames.append({name: columns[name][keep] for name in
+                           ("rentabilidad_anual", "delta", "strike_distance", "bid", "net_risk")})
+            names.append(ticker)
+
+    if not frames:
+        return None
+    candidates = {name: np.concatenate([frame[name] for frame in frames]) for name in frames[0]}
+    sizes = np.array([len(frame["delta"]) for frame in frames])
+    ticker_index = np.repeat(np.arange(len(frames)), sizes)
+    ranking = np.nan_to_num(candidates["rentabilidad_anual"], nan=-np.inf)
+    # lexsort es estable: los empates conservan el orden original, como en select_top
+    order = np.lexsort((-ranking, ticker_index))
+    candidates = {name: values[order] for name, values in candidates.items()}
+    candidates["starts"] = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    candidates["sizes"] = sizes
+    candidates["names"] = names
+    return candidates
+
+def evaluate_grid(candidates, grid, config, chunk_elements=CHUNK_ELEMENTS):
+    """
+    Evalúa todas las configuraciones de `grid` sobre los candidatos y devuelve un DataFrame con una fila por configuración.
+
+    Columnas: los parámetros, `contracts` (contratos que pasan los filtros),
+    `selected` (los que elegiría el screen: como mucho
+    TOP_CONTRATOS_PER_TICKER por ticker), `tickers`, `avg_yield` (rentabilidad
+    anual media de los seleccionados) y `capital_at_risk` (suma de su riesgo neto).
+    """
+    count = len(next(iter(grid.values())))
+    results = {name: values for name, values in grid.items()}
+    for column in ("contracts", "selected", "tickers"):
+        results[column] = np.zeros(count, dtype=np.int64)
+    results["avg_yield"] = np.full(count, np.nan)
+    results["capital_at_risk"] = np.zeros(count)
+    if candidates is None:
+        return pd.DataFrame(results)
+
+    rentabilidad = candidates["rentabilidad_anual"]
+    delta, strike_distance = candidates["delta"], candidates["strike_distance"]
+    bid, net_risk = candidates["bid"], candidates["net_risk"]
+    starts, sizes = candidates["starts"], candidates["sizes"]
+    yield_values, risk_values = np.nan_to_num(rentabilidad), np.nan_to_num(net_risk)
+    top_k = config["TOP_CONTRATOS_PER_TICKER"]
+    step = max(1, chunk_elements // len(delta))
+
+    for start in range(0, count, step):
+        block = slice(start, min(start + step, count))
+        g = {name: values[block, None] for name, values in grid.items()}
+        valid = (~(rentabilidad < g["MIN_RENTABILIDAD_ANUAL"])
+                 & ~(strike_distance < g["MIN_STRIKE_DISTANCE"])
+                 & ~(bid < g["MIN_BID"])
+                 & (delta >= g["TARGET_DELTA_MIN"]) & (delta <= g["TARGET_DELTA_MAX"])
+                 & ~(net_risk > config["CAPITAL"] * g["MAX_RISK_PER_TRADE"]))
+        # Posición de cada contrato entre los válidos de su ticker (ya ordenados por rentabilidad)
+        cumulative = np.cumsum(valid, axis=1, dtype=np.int32)
+        before = np.zeros((cumulative.shape[0], len(starts)), dtype=np.int32)
+        before[:, 1:] = cumulative[:, starts[1:] - 1]
+        selected = valid & (cumulative - np.repeat(before, sizes, axis=1) <= top_k)
+
+        selected_count = selected.sum(axis=1)
+        selected_float = selected.astype(np.float64)
+        results["contracts"][block] = valid.sum(axis=1)
+        results["selected"][block] = selected_count
+        results["tickers"][block] = (np.add.reduceat(selected, starts, axis=1) > 0).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results["avg_yield"][block] = (selected_float @ yield_values) / selected_count
+        results["capital_at_risk"][block] = selected_float @ risk_values
+    return pd.DataFrame(results)
+
+def run_sweep(group_name, values_by_parameter):
+    """
+    Descarga una vez los datos del grupo y evalúa la rejilla. Devuelve (resultados, segundos de evaluación).
+    """
+    group_config = GROUPS_CONFIG[group_name]
+    config = group_config["config"]
+    unknown = set(values_by_parameter) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Parámetros no barribles: {', '.join(sorted(unknown))}")
+
+    # Se descargan todas las cadenas hasta MAX_DIAS_VENCIMIENTO de los tickers que superan el pre-filtro
+    snapshots, _, _ = prefetch_groups({group_name: group_config})
+    grid = build_grid(values_by_parameter, config)
+    start = time.perf_counter()
+    candidates = collect_candidates(group_config["tickers"], config, snapshots)
+    results = evaluate_grid(candidates, grid, config)
+    elapsed = time.perf_counter() - start
+    logger.info(f"{len(results)} configuraciones evaluadas sobre "
+                f"{0 if candidates is None else len(candidates['delta'])} contratos en {elapsed:.2f}s")
+    return results, elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Barrido de umbrales del screen de short PUT sobre una sola descarga")
+    parser.add_argument("--group", default=next(iter(GROUPS_CONFIG)), help="Grupo de GROUPS_CONFIG que se barre")
+    parser.add_argument("--param", action="append", default=[], metavar="NOMBRE=VALORES",
+                        help=f"Valores de un umbral ({', '.join(SWEEP_PARAMETERS)}): lista 'a,b,c' o rango 'inicio:fin:paso'")
+    parser.add_argument("--output", default="sweep_results.csv", help="Fichero CSV con todas las configuraciones")
+    parser.add_argument("--sort", default="avg_yield",
+                        choices=("avg_yield", "selected", "contracts", "tickers", "capital_at_risk"),
+                        help="Columna por la que se ordena el resumen")
+    parser.add_argument("--top", type=int, default=10, help="Configuraciones que se muestran en el resumen")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+    specs = dict(DEFAULT_GRID) if not args.param else {}
+    for spec in args.param:
+        name, _, values = spec.partition("=")
+        specs[name.strip()] = values
+    results, elapsed = run_sweep(args.group, {name: parse_values(values) for name, values in specs.items()})
+
+    results.to_csv(args.output, index=False)
+    summary = results[results["selected"] > 0].sort_values(args.sort, ascending=False, kind="stable")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(summary.head(args.top).to_string(index=False))
+    print(f"{len(results)} configuraciones en {elapsed:.2f}s; resultados en {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())